@@ -0,0 +1,276 @@
+import os
+import sys
+import csv
+import json
+import glob
+import time
+import platform
+import resource
+import subprocess
+import threading
+import sbp
+import bitboard
+from fifo_queue import Queue
+from priority_queue import PriorityQueue
+
+LEVELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SBP-levels")
+LEVELS = [os.path.join(LEVELS_DIR, name) for name in [
+    "SBP-level3.txt",
+    "SBP-bricks-level1.txt",
+    "SBP-bricks-level2.txt",
+    "SBP-bricks-level3.txt",
+    "SBP-bricks-level4.txt",
+    "SBP-bricks-level5.txt",
+    "SBP-bricks-level6.txt",
+    "SBP-bricks-level7.txt"
+]]
+
+SBP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sbp.py")
+SUITE_ALGORITHMS = {
+    "bfs": ["bfs"],
+    "dfs": ["dfs"],
+    "ids": ["ids"],
+    "idastar": ["idastar"],
+    "astar": ["astar"],
+    "bfs-bitboard": ["bfs", "--bitboard"],
+    "astar-bitboard": ["astar", "--bitboard"],
+    "bfs-vectorized": ["bfs", "--vectorized"],
+    "beam": ["beam"]
+}
+# Wall time increases smaller than this many seconds are noise, not regressions.
+SUITE_WALL_FLOOR = 0.1
+SUITE_COLUMNS = ["level", "algorithm", "status", "length", "nodes", "wall", "solver_time", "rss_mb"]
+SUITE_OPTIONS = {"--repeat": 3, "--timeout": 60.0, "--memory-mb": 4096, "--threshold": 0.2,
+                 "--algorithms": ",".join(SUITE_ALGORITHMS), "--save": None, "--compare": None, "--csv": None}
+
+class ListQueue(Queue):
+    def __init__(self):
+        self.items = []
+        
+    def pop(self):
+        if not self.is_empty():
+            return self.items.pop(0)
+        return None
+
+def time_bfs(filename, queue_class):
+    level, board = sbp.load_board(filename)
+    start_time = time.perf_counter()
+    result = sbp.search(level, board, queue_class())
+    elapsed = time.perf_counter() - start_time
+    return result.nodes_explored, elapsed
+
+def time_search(filename, data_structure_class, engine):
+    level, board = sbp.load_board(filename)
+    level, board = sbp.to_engine(level, board, engine)
+    start_time = time.perf_counter()
+    result = sbp.search(level, board, data_structure_class(), engine)
+    elapsed = time.perf_counter() - start_time
+    return result.nodes_explored, elapsed
+
+def time_vectorized(filename):
+    level, board = sbp.load_board(filename)
+    start_time = time.perf_counter()
+    result = sbp.vectorized_bfs(level, board)
+    elapsed = time.perf_counter() - start_time
+    return result.nodes_explored, elapsed
+
+def bench_queues(levels):
+    print(f"{'level':<24}{'nodes':>8}{'list (n/s)':>14}{'deque (n/s)':>14}{'speedup':>9}")
+    for filename in levels:
+        name = os.path.basename(filename).removesuffix(".txt")
+        nodes, list_time = time_bfs(filename, ListQueue)
+        _, deque_time = time_bfs(filename, Queue)
+        print(f"{name:<24}{nodes:>8}{nodes / list_time:>14.0f}{nodes / deque_time:>14.0f}{list_time / deque_time:>8.2f}x")
+
+def bench_engines(levels):
+    print(f"{'level':<24}{'search':>8}{'nodes':>8}{'bytes (n/s)':>14}{'bits (n/s)':>14}{'speedup':>9}")
+    for filename in levels:
+        name = os.path.basename(filename).removesuffix(".txt")
+        for search_name, data_structure_class in [("bfs", Queue), ("astar", PriorityQueue)]:
+            nodes, bytes_time = time_search(filename, data_structure_class, sbp)
+            _, bits_time = time_search(filename, data_structure_class, bitboard)
+            print(f"{name:<24}{search_name:>8}{nodes:>8}{nodes / bytes_time:>14.0f}{nodes / bits_time:>14.0f}{bytes_time / bits_time:>8.2f}x")
+
+def bench_vectorized(levels):
+    print(f"{'level':<24}{'nodes':>8}{'scalar (n/s)':>14}{'numpy (n/s)':>14}{'speedup':>9}")
+    for filename in levels:
+        name = os.path.basename(filename).removesuffix(".txt")
+        nodes, scalar_time = time_bfs(filename, Queue)
+        vector_nodes, vector_time = time_vectorized(filename)
+        print(f"{name:<24}{nodes:>8}{nodes / scalar_time:>14.0f}{vector_nodes / vector_time:>14.0f}{scalar_time / vector_time:>8.2f}x")
+
+def all_levels():
+    return sorted(glob.glob(os.path.join(LEVELS_DIR, "*.txt")))
+
+def run_solver(arguments, filename, timeout, memory_mb):
+    # One sbp.py run in a child process capped at timeout seconds and
+    # memory_mb of address space. wait4 gives the child's own peak RSS.
+    def limit_memory():
+        limit = memory_mb << 20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    start_time = time.perf_counter()
+    process = subprocess.Popen([sys.executable, SBP] + arguments + [filename], stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True, preexec_fn=limit_memory)
+    timer = threading.Timer(timeout, process.kill)
+    timer.start()
+    output = process.stdout.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    timer.cancel()
+    process.stdout.close()
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - start_time
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    rss = usage.ru_maxrss / (1 << 20) if sys.platform == "darwin" else usage.ru_maxrss / 1024
+    result = {"status": "ok", "length": None, "nodes": None, "wall": wall, "solver_time": None, "rss_mb": rss}
+    lines = output.strip().splitlines()
+    if process.returncode < 0:
+        result["status"] = "timeout" if wall >= timeout else "killed"
+    elif process.returncode != 0 or len(lines) < 3:
+        result["status"] = "memory" if "MemoryError" in output else "error"
+    else:
+        result["nodes"] = int(lines[-3])
+        result["solver_time"] = float(lines[-2])
+        if lines[-1] == "No solution found":
+            result["status"] = "unsolved"
+        else:
+            result["length"] = int(lines[-1])
+    return result
+
+def bench_suite(levels, options):
+    # Every level with every algorithm, repeat times each; the run with the
+    # median wall time is kept so one slow run does not skew the baseline.
+    algorithms = options["--algorithms"].split(",")
+    for algorithm in algorithms:
+        if algorithm not in SUITE_ALGORITHMS:
+            print(f"Error: Unknown algorithm '{algorithm}'")
+            sys.exit(1)
+    results = []
+    width = max(len(os.path.basename(filename)) for filename in levels)
+    print(f"{'level':<{width}}{'algorithm':<16}{'status':<10}{'length':>7}{'nodes':>10}{'wall (s)':>10}{'rss (MB)':>10}")
+    for filename in levels:
+        name = os.path.basename(filename).removesuffix(".txt")
+        for algorithm in algorithms:
+            runs = []
+            for _ in range(options["--repeat"]):
+                runs.append(run_solver(SUITE_ALGORITHMS[algorithm], filename, options["--timeout"], options["--memory-mb"]))
+                if runs[-1]["status"] in ("timeout", "killed", "memory"):
+                    break
+            runs.sort(key=lambda run: run["wall"])
+            result = dict(runs[len(runs) // 2], level=name, algorithm=algorithm)
+            result["rss_mb"] = max(run["rss_mb"] for run in runs)
+            results.append(result)
+            length = "-" if result["length"] is None else result["length"]
+            nodes = "-" if result["nodes"] is None else result["nodes"]
+            print(f"{name:<{width}}{algorithm:<16}{result['status']:<10}{length:>7}{nodes:>10}{result['wall']:>10.2f}{result['rss_mb']:>10.1f}", flush=True)
+    return results
+
+def find_regressions(results, baseline, threshold):
+    previous = {(result["level"], result["algorithm"]): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get((result["level"], result["algorithm"]))
+        if old is None:
+            continue
+        name = f"{result['level']} {result['algorithm']}"
+        if old["status"] == "ok" and result["status"] != "ok":
+            regressions.append(f"{name}: {old['status']} -> {result['status']}")
+            continue
+        # A baseline row that timed out or failed has no length or node count
+        # to measure against, so only ok rows on both sides are compared.
+        if result["status"] != "ok" or old["status"] != "ok":
+            continue
+        if result["length"] > old["length"]:
+            regressions.append(f"{name}: length {old['length']} -> {result['length']}")
+        for column in ("nodes", "wall", "rss_mb"):
+            if column == "wall" and result["wall"] - old["wall"] < SUITE_WALL_FLOOR:
+                continue
+            if old[column] and result[column] > old[column] * (1 + threshold):
+                regressions.append(f"{name}: {column} {old[column]:.6g} -> {result[column]:.6g}")
+    return regressions
+
+def parse_suite_options(argv):
+    options = dict(SUITE_OPTIONS)
+    levels = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg not in options:
+            levels.extend(sorted(glob.glob(os.path.join(arg, "*.txt"))) if os.path.isdir(arg) else [arg])
+            i += 1
+            continue
+        if i + 1 >= len(argv):
+            print(f"Error: Option '{arg}' requires a value")
+            sys.exit(1)
+        default = SUITE_OPTIONS[arg]
+        try:
+            options[arg] = type(default)(argv[i + 1]) if default is not None else argv[i + 1]
+        except ValueError:
+            print(f"Error: Invalid value for '{arg}'")
+            sys.exit(1)
+        i += 2
+    if options["--repeat"] < 1:
+        print("Error: --repeat must be a positive integer")
+        sys.exit(1)
+    if options["--timeout"] <= 0:
+        print("Error: --timeout must be a positive number of seconds")
+        sys.exit(1)
+    if options["--memory-mb"] < 1:
+        print("Error: --memory-mb must be a positive number of megabytes")
+        sys.exit(1)
+    return levels or all_levels(), options
+
+def suite(argv):
+    levels, options = parse_suite_options(argv)
+    results = bench_suite(levels, options)
+    if options["--save"] is not None:
+        baseline = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": options["--repeat"],
+            "timeout": options["--timeout"],
+            "results": results
+        }
+        with open(options["--save"], 'w') as file:
+            json.dump(baseline, file, indent=1)
+    if options["--csv"] is not None:
+        with open(options["--csv"], 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=SUITE_COLUMNS)
+            writer.writeheader()
+            for result in results:
+                writer.writerow({column: result[column] for column in SUITE_COLUMNS})
+    if options["--compare"] is not None:
+        try:
+            with open(options["--compare"], 'r') as file:
+                baseline = json.load(file)
+        except (IOError, ValueError):
+            print(f"Error: Could not read baseline '{options['--compare']}'")
+            sys.exit(1)
+        regressions = find_regressions(results, baseline, options["--threshold"])
+        print()
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        print(f"{len(regressions)} regressions against {options['--compare']}")
+        if regressions:
+            sys.exit(1)
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("queues", "engines", "vectorized", "suite"):
+        print("Usage: python3 benchmark.py queues|engines|vectorized [<level-file> ...]")
+        print("       python3 benchmark.py suite [<level-file> ...] [--algorithms a,b] [--repeat N] [--timeout S]")
+        print("                                  [--memory-mb M] [--save FILE] [--csv FILE] [--compare FILE] [--threshold F]")
+        sys.exit(1)
+    if sys.argv[1] == "suite":
+        suite(sys.argv[2:])
+        return
+    levels = sys.argv[2:] if len(sys.argv) > 2 else LEVELS
+    match sys.argv[1]:
+        case "queues":
+            bench_queues(levels)
+        case "engines":
+            bench_engines(levels)
+        case "vectorized":
+            bench_vectorized(levels)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import sys
+from cells import GOAL, EMPTY_CELL, WALL, GOAL_CELL, MASTER_SALT, mix_hash
+
+#CONSTANTS
+DIRECTION_ORDER = ["UP", "RIGHT", "DOWN", "LEFT"]
+
+class BitLevel:
+    # The bitboard counterpart of sbp.Level: the wall mask, the edge masks
+    # shift checks against and the row mirror table for symmetric levels.
+    __slots__ = ("rows", "cols", "walls", "top_row", "bottom_row", "left_col", "right_col",
+                 "distance_fields", "row_mirror", "zobrist_cells", "zobrist_goals")
+
+    def __init__(self, cells, cols, rows, distance_fields, zobrist_cells, zobrist_goals):
+        self.cols, self.rows = cols, rows
+        self.zobrist_cells = zobrist_cells
+        self.zobrist_goals = zobrist_goals
+        self.walls = cells_mask(cells, WALL)
+        row = (1 << cols) - 1
+        self.top_row = row
+        self.bottom_row = row << (rows - 1) * cols
+        self.left_col = 0
+        self.right_col = 0
+        for y in range(rows):
+            self.left_col |= 1 << y * cols
+            self.right_col |= 1 << y * cols + cols - 1
+        self.distance_fields = [(1 << goal, distances) for goal, distances in distance_fields]
+        self.row_mirror = init_symmetry(self, cells_mask(cells, GOAL_CELL))
+
+class BitBoard:
+    # Every piece, and the goal cells not yet covered, is an int with bit
+    # y * cols + x set for each cell (x, y) it covers.
+    __slots__ = ("pieces", "goals", "occupied", "state_hash", "mirror_hash", "key")
+
+    def __init__(self, level, pieces, goals, occupied=None, state_hash=None, mirror_hash=None):
+        self.pieces = pieces
+        self.goals = goals
+        if occupied is None:
+            occupied = 0
+            for mask in pieces.values():
+                occupied |= mask
+        self.occupied = occupied
+        if state_hash is None:
+            state_hash = board_hash(level, pieces, goals, False)
+        if mirror_hash is None and level.row_mirror is not None:
+            mirror_hash = board_hash(level, pieces, goals, True)
+        self.state_hash = state_hash
+        self.mirror_hash = mirror_hash
+        self.key = state_hash if mirror_hash is None else min(state_hash, mirror_hash)
+
+    def __eq__(self, other):
+        return isinstance(other, BitBoard) and self.goals == other.goals and self.pieces == other.pieces
+
+    def __hash__(self):
+        return self.state_hash
+
+def mask_key(mask, cell_keys):
+    key = 0
+    while mask:
+        low = mask & -mask
+        key ^= cell_keys[low.bit_length() - 1]
+        mask ^= low
+    return key
+
+def piece_key(level, piece, mask):
+    # Label-free like the Zobrist hash in sbp.py: only the cells a piece
+    # covers, and whether it is the master piece, go into the key.
+    key = MASTER_SALT if piece == 2 else 0
+    return mix_hash(key ^ mask_key(mask, level.zobrist_cells))
+
+def goal_key(level, goals):
+    return mask_key(goals, level.zobrist_goals)
+
+def board_hash(level, pieces, goals, mirrored):
+    if mirrored:
+        board_key = goal_key(level, mirror_mask(level, goals))
+        for piece, mask in pieces.items():
+            board_key ^= piece_key(level, piece, mirror_mask(level, mask))
+    else:
+        board_key = goal_key(level, goals)
+        for piece, mask in pieces.items():
+            board_key ^= piece_key(level, piece, mask)
+    return board_key
+
+def mirror_mask(level, mask):
+    mirrored = 0
+    offset = 0
+    row = (1 << level.cols) - 1
+    while mask:
+        mirrored |= level.row_mirror[mask & row] << offset
+        mask >>= level.cols
+        offset += level.cols
+    return mirrored
+
+def init_symmetry(level, goals):
+    # Same reduction as init_symmetry in sbp.py: on a level whose walls and
+    # goal cells are left-right symmetric, a board and its mirror image share
+    # a key.
+    if level.cols > 16:
+        return None
+    level.row_mirror = [int(format(row, f"0{level.cols}b")[::-1], 2) for row in range(1 << level.cols)]
+    if mirror_mask(level, level.walls) != level.walls or mirror_mask(level, goals) != goals:
+        return None
+    return level.row_mirror
+
+def cells_mask(cells, value):
+    mask = 0
+    for i, cell in enumerate(cells):
+        if cell == value:
+            mask |= 1 << i
+    return mask
+
+def from_board(level, board):
+    pieces = {}
+    for piece, piece_cells in board.pieces.items():
+        mask = 0
+        for i in piece_cells:
+            mask |= 1 << i
+        pieces[piece] = mask
+    return BitBoard(level, pieces, cells_mask(board.cells, GOAL_CELL))
+
+def to_cells(level, board):
+    cells = []
+    for i in range(level.rows * level.cols):
+        bit = 1 << i
+        if level.walls & bit:
+            cells.append(WALL)
+        elif board.goals & bit:
+            cells.append(GOAL)
+        else:
+            cells.append(EMPTY_CELL)
+    for piece, mask in board.pieces.items():
+        while mask:
+            low = mask & -mask
+            cells[low.bit_length() - 1] = piece
+            mask ^= low
+    return cells
+
+def shift(level, mask, direction):
+    match direction:
+        case "UP":
+            return None if mask & level.top_row else mask >> level.cols
+        case "DOWN":
+            return None if mask & level.bottom_row else mask << level.cols
+        case "LEFT":
+            return None if mask & level.left_col else mask >> 1
+        case "RIGHT":
+            return None if mask & level.right_col else mask << 1
+
+def get_available_moves(level, board):
+    moves = []
+    blocked = level.walls | board.occupied
+    for piece, mask in board.pieces.items():
+        piece_blocked = blocked if piece == 2 else blocked | board.goals
+        for direction in DIRECTION_ORDER:
+            shifted = shift(level, mask, direction)
+            if shifted is not None and shifted & ~mask & piece_blocked == 0:
+                moves.append((piece, direction))
+    return moves
+
+def apply_move(level, board, move):
+    if not isinstance(move, tuple) or len(move) != 2:
+        print("Error: Invalid move")
+        sys.exit(1)
+
+    piece, direction = move
+
+    if not isinstance(piece, int) or direction not in DIRECTION_ORDER:
+        print("Error: Invalid move")
+        sys.exit(1)
+
+    mask = board.pieces.get(piece)
+    if not mask:
+        return board
+    shifted = shift(level, mask, direction)
+    if shifted is None:
+        print("Error: Invalid move")
+        sys.exit(1)
+
+    pieces = dict(board.pieces)
+    pieces[piece] = shifted
+    goals = board.goals & ~shifted
+    state_hash = board.state_hash ^ piece_key(level, piece, mask) ^ piece_key(level, piece, shifted)
+    if goals != board.goals:
+        state_hash ^= goal_key(level, board.goals) ^ goal_key(level, goals)
+    mirror_hash = board.mirror_hash
+    if mirror_hash is not None:
+        mirror_hash ^= piece_key(level, piece, mirror_mask(level, mask)) ^ piece_key(level, piece, mirror_mask(level, shifted))
+        if goals != board.goals:
+            mirror_hash ^= goal_key(level, mirror_mask(level, board.goals)) ^ goal_key(level, mirror_mask(level, goals))
+    return BitBoard(level, pieces, goals, board.occupied ^ mask ^ shifted, state_hash, mirror_hash)
+
+def normalize_board(level, board):
+    order = sorted((piece for piece in board.pieces if piece != 2), key=lambda piece: board.pieces[piece] & -board.pieces[piece])
+    if all(piece == label for label, piece in enumerate(order, 3)):
+        return board
+    pieces = {2: board.pieces[2]} if 2 in board.pieces else {}
+    for label, piece in enumerate(order, 3):
+        pieces[label] = board.pieces[piece]
+    return BitBoard(level, pieces, board.goals, board.occupied, board.state_hash, board.mirror_hash)
+
+def check_solution(board):
+    return board.goals == 0
+
+def calculate_heuristic(level, board):
+    if board.goals == 0:
+        return 0
+    master = board.pieces.get(2)
+    if not master:
+        print("Error: No piece 2 found")
+        sys.exit(1)
+    anchor = (master & -master).bit_length() - 1
+    distance = 0
+    for goal, distances in level.distance_fields:
+        if board.goals & goal and distances[anchor] > distance:
+            distance = distances[anchor]
+    return distance
+
+def print_board(level, board):
+    cells = to_cells(level, board)
+    print(str(level.cols) + ", " + str(level.rows))
+    for i in range(level.rows):
+        print(' ' + ', '.join(f"{cell:2d}" for cell in cells[i * level.cols:(i + 1) * level.cols]))
@@ -0,0 +1,13 @@
+#CONSTANTS
+GOAL = -1
+EMPTY_CELL = 0
+WALL = 1
+GOAL_CELL = GOAL & 0xFF
+HASH_MASK = (1 << 64) - 1
+MASTER_SALT = 0x9e3779b97f4a7c15
+
+# Shared by sbp.py and bitboard.py so both engines hash a board the same way.
+def mix_hash(key):
+    key = ((key ^ (key >> 30)) * 0xbf58476d1ce4e5b9) & HASH_MASK
+    key = ((key ^ (key >> 27)) * 0x94d049bb133111eb) & HASH_MASK
+    return key ^ (key >> 31)
@@ -1,13 +1,15 @@
+from collections import deque
+
 class Queue:
     def __init__(self):
-        self.items = []
+        self.items = deque()
         
     def push(self, item, priority = None):
         self.items.append(item)
         
     def pop(self):
         if not self.is_empty():
-            return self.items.pop(0)
+            return self.items.popleft()
         return None
         
     def is_empty(self):
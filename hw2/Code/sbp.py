@@ -1,14 +1,26 @@
+import os
 import sys
+import io
+import stat
+import copy
+import json
+import heapq
 import random
-from queue import Queue
+import resource
+from contextlib import redirect_stdout
+from array import array
+from collections import deque
+from functools import partial
+from itertools import combinations, product
+from math import comb
+from fifo_queue import Queue
 from stack import Stack
 from priority_queue import PriorityQueue
+from cells import GOAL, EMPTY_CELL, WALL, GOAL_CELL, MASTER_SALT, mix_hash
+import bitboard
 import time
 
 #CONSTANTS
-GOAL = -1
-EMPTY_CELL = 0
-WALL = 1
 DIRECTIONS = {
     "UP": (0, -1),
     "DOWN": (0, 1),
@@ -16,23 +28,47 @@ DIRECTIONS = {
     "RIGHT": (1, 0)
 }
 
+TABLE_LIMIT = 1 << 20
+PDB_LIMIT = 1 << 22
+PDB_UNKNOWN = 0xFF
+PARALLEL_BATCH = 64
+EXTERNAL_MEMORY_MB = 256
+CACHE_SIZE_MB = 64
+BEAM_WIDTH = 1000
+ANYTIME_WEIGHT = 3.0
+ANYTIME_STEP = 0.5
+ANYTIME_TIME_MS = 1000
+STATS_INTERVAL = 4096
+SOLVE_TIMEOUT = 60.0
+SCRAMBLE_ATTEMPTS = 100
+OPTIMAL_ALGORITHMS = {"bfs", "astar", "ids", "idastar"}
+FLAG_OPTIONS = {"--bitboard", "--external", "--vectorized", "--trace-memory", "--exact"}
+VALUE_OPTIONS = {"--workers", "--memory", "--cache", "--cache-size", "--socket", "--width",
+                 "--time-ms", "--weight", "--stats", "--profile", "--timeout", "--history", "--seed", "--output"}
+SEARCH_COMMANDS = {"bfs", "dfs", "ids", "idastar", "astar", "beam", "anytime"}
+STATS_COMMANDS = {"bfs", "dfs", "ids", "idastar", "astar"}
+BITBOARD_COMMANDS = {"bfs", "dfs", "astar"}
+WORKER_COMMANDS = {"bfs", "astar"}
+ALGORITHM_NAMES = {Queue: "bfs", Stack: "dfs", PriorityQueue: "astar"}
+
 #GLOBAL VARIABLES
-ROWS = 0
-COLS = 0
+SOLUTION_CACHE = None
+LEVELS = {}
+PATTERN_LEVELS = {}
 
-def random_walk(board, n):
+def random_walk(level, board, n):
     moves_made = 0
     while moves_made < n:
-        available_moves = get_available_moves(board)
+        available_moves = get_available_moves(level, board)
         if not available_moves:
             print("No moves available!")
             break
         move = random.choice(available_moves)
         piece, direction = move
         print(f"Move {moves_made + 1}: ({piece}, {direction})")
-        apply_move(board, move)
-        normalize_board(board)
-        #print_board(board)
+        board = apply_move(level, board, move)
+        board = normalize_board(level, board)
+        #print_board(level, board)
         #print()
         if check_solution(board):
             print("Goal reached!")
@@ -40,38 +76,163 @@ def random_walk(board, n):
             
         moves_made += 1
 
-def swap_indices(idx1, idx2, board):
-    for i in range(ROWS):
-        for j in range(COLS):
-            if int(board[i][j]) == idx1:
-                board[i][j] = str(idx2)
-            elif int(board[i][j]) == idx2:
-                board[i][j] = str(idx1)
-    return board
-
-def normalize_board(board):
-    next_idx = 3
-    for i in range(ROWS):
-        for j in range(COLS):
-            current = int(board[i][j])
-            if current == next_idx:
-                next_idx += 1
-            elif current > next_idx:
-                board = swap_indices(next_idx, current, board)
-                next_idx += 1 
-    return board
-
-def compare_boards(board1, board2):
-    if len(board1) != len(board2) or len(board1[0]) != len(board2[0]):
+def scramble_walk(level, board, depth, rng, successors):
+    # A random walk that never steps back onto a board it has already been
+    # on, so it drifts away from the start instead of circling near it.
+    # successors caches the children of every board walked through, since
+    # walks from one start keep passing through the same boards. Returns the
+    # board the walk ended on and how many moves it took.
+    visited = {board.key}
+    steps = 0
+    for _ in range(depth):
+        children = successors.get(board.key)
+        if children is None:
+            children = [apply_move(level, board, move) for move in get_available_moves(level, board)]
+            if len(successors) < TABLE_LIMIT:
+                successors[board.key] = children
+        children = [child for child in children if child.key not in visited]
+        if not children:
+            break
+        board = rng.choice(children)
+        visited.add(board.key)
+        steps += 1
+    return board, steps
+
+def random_scrambles(level, board, count, depth, rng):
+    # Walks are cheap, so keep walking until count distinct unsolved boards
+    # turn up. A walk that gets stuck stops short of depth, so each board
+    # comes with the length of the walk that found it.
+    scrambles = {}
+    successors = {}
+    attempts = 0
+    while len(scrambles) < count and attempts < count * SCRAMBLE_ATTEMPTS:
+        attempts += 1
+        scrambled, steps = scramble_walk(level, board, depth, rng, successors)
+        if scrambled.key not in scrambles and not check_solution(scrambled):
+            scrambles[scrambled.key] = (scrambled, steps)
+    return list(scrambles.values())
+
+def exact_scrambles(level, board, count, depth, rng):
+    # Breadth-first from the start board, so every board in the last layer
+    # is exactly depth moves away from it.
+    layer = {board.key: board}
+    previous = {}
+    for _ in range(depth):
+        next_layer = {}
+        for current in layer.values():
+            for move in get_available_moves(level, current):
+                child = apply_move(level, current, move)
+                if child.key not in layer and child.key not in previous and child.key not in next_layer:
+                    next_layer[child.key] = child
+        previous, layer = layer, next_layer
+    candidates = [scrambled for scrambled in layer.values() if not check_solution(scrambled)]
+    return [(scrambled, depth) for scrambled in rng.sample(candidates, min(count, len(candidates)))]
+
+class Level:
+    # Everything about a puzzle that stays fixed while it is solved: the
+    # dimensions, the walls and goal, the Zobrist keys and the heuristic
+    # tables. Boards only hold their cells, so boards of different levels
+    # can be searched side by side.
+    __slots__ = ("cols", "rows", "layout", "offsets", "zobrist_cells", "zobrist_goals",
+                 "mirror_cells", "mirror_goals", "distance_fields", "pattern_databases")
+
+    def __init__(self, cols, rows, cells):
+        self.cols = cols
+        self.rows = rows
+        self.layout = static_layout(cells)
+        self.offsets = {direction: dy * cols + dx for direction, (dx, dy) in DIRECTIONS.items()}
+        self.zobrist_cells, self.zobrist_goals = init_zobrist(rows * cols)
+        self.mirror_cells, self.mirror_goals = init_symmetry(self)
+        self.distance_fields = build_distance_fields(self, index_pieces(cells).get(2, ()))
+        self.pattern_databases = []
+
+class Board:
+    __slots__ = ("cells", "pieces", "zobrist", "mirror", "key")
+
+    def __init__(self, level, cells, pieces=None, zobrist=None, mirror=None):
+        self.cells = cells
+        self.pieces = pieces if pieces is not None else index_pieces(cells)
+        self.zobrist = zobrist if zobrist is not None else zobrist_hash(self, level.zobrist_cells, level.zobrist_goals)
+        if mirror is None and level.mirror_cells is not None:
+            mirror = zobrist_hash(self, level.mirror_cells, level.mirror_goals)
+        self.mirror = mirror
+        # Search deduplicates on key, which treats a board and its mirror
+        # image as the same state when the level is left-right symmetric.
+        self.key = self.zobrist if mirror is None else min(self.zobrist, mirror)
+
+    def __eq__(self, other):
+        return isinstance(other, Board) and self.cells == other.cells
+
+    def __hash__(self):
+        return self.zobrist
+
+def init_zobrist(size, seed=380):
+    rng = random.Random(seed)
+    zobrist_cells = [rng.getrandbits(64) for _ in range(size)]
+    zobrist_goals = [rng.getrandbits(64) for _ in range(size)]
+    return zobrist_cells, zobrist_goals
+
+def init_symmetry(level):
+    cols = level.cols
+    size = level.rows * cols
+    mirror = [i - i % cols + cols - 1 - i % cols for i in range(size)]
+    if any(level.layout[i] != level.layout[mirror[i]] for i in range(size)):
+        return None, None
+    return [level.zobrist_cells[mirror[i]] for i in range(size)], [level.zobrist_goals[mirror[i]] for i in range(size)]
+
+def piece_hash(piece, piece_cells, cell_keys):
+    key = MASTER_SALT if piece == 2 else 0
+    for i in piece_cells:
+        key ^= cell_keys[i]
+    return mix_hash(key)
+
+def zobrist_hash(board, cell_keys, goal_keys):
+    # Pieces are hashed by the cells they cover, not by their label, so the
+    # hash is unchanged by normalize_board and by relabeling in general.
+    zobrist = 0
+    for piece, piece_cells in board.pieces.items():
+        zobrist ^= piece_hash(piece, piece_cells, cell_keys)
+    index = board.cells.find(GOAL_CELL)
+    while index != -1:
+        zobrist ^= goal_keys[index]
+        index = board.cells.find(GOAL_CELL, index + 1)
+    return zobrist
+
+def index_pieces(cells):
+    pieces = {}
+    for i, value in enumerate(cells):
+        if value != EMPTY_CELL and value != WALL and value != GOAL_CELL:
+            pieces.setdefault(value, []).append(i)
+    return {piece: tuple(pieces[piece]) for piece in sorted(pieces)}
+
+def relabel_table(board):
+    order = [piece for piece in dict.fromkeys(board.cells) if 2 < piece < GOAL_CELL]
+    table = None
+    for label, piece in enumerate(order, 3):
+        if piece != label:
+            if table is None:
+                table = bytearray(range(256))
+            table[piece] = label
+    return table
+
+def relabel_cells(cells, table):
+    return cells if table is None else cells.translate(table)
+
+def relabel_board(level, board, table):
+    if table is None:
+        return board
+    pieces = {table[piece]: piece_cells for piece, piece_cells in board.pieces.items()}
+    return Board(level, relabel_cells(board.cells, table), dict(sorted(pieces.items())), board.zobrist, board.mirror)
+
+def normalize_board(level, board):
+    return relabel_board(level, board, relabel_table(board))
+
+def compare_boards(level1, board1, level2, board2):
+    if level1.cols != level2.cols or level1.rows != level2.rows:
         return False
-    
-    for i in range(len(board1)):
-        for j in range(len(board1[0])):
-            if board1[i][j] != board2[i][j]:
-                return False
-    return True
+    return board1 == board2
 
-def apply_move(board, move):
+def apply_move(level, board, move):
     if not isinstance(move, tuple) or len(move) != 2:
         print("Error: Invalid move")
         sys.exit(1)
@@ -82,329 +243,1903 @@ def apply_move(board, move):
         print("Error: Invalid move")
         sys.exit(1)
         
-    coords = find_piece_coordinates(board, piece)
+    piece_cells = find_piece_cells(board, piece)
     
     if direction not in DIRECTIONS:
         print("Error: Invalid move")
         sys.exit(1)
+    
+    if not piece_cells:
+        return board
         
-    dx, dy = DIRECTIONS[direction]
-    new_coords = [(x + dx, y + dy) for x, y in coords]
+    offset = level.offsets[direction]
+    new_piece_cells = tuple(i + offset for i in piece_cells)
     
-    new_board = [row[:] for row in board]
+    new_cells = bytearray(board.cells)
+    zobrist = board.zobrist ^ piece_hash(piece, piece_cells, level.zobrist_cells) ^ piece_hash(piece, new_piece_cells, level.zobrist_cells)
+    mirror = board.mirror
+    if mirror is not None:
+        mirror ^= piece_hash(piece, piece_cells, level.mirror_cells) ^ piece_hash(piece, new_piece_cells, level.mirror_cells)
         
-    for x, y in coords:
-        new_board[y][x] = str(EMPTY_CELL)
+    for i in piece_cells:
+        new_cells[i] = EMPTY_CELL
           
-    for x, y in new_coords:
-        new_board[y][x] = str(piece)
+    for i in new_piece_cells:
+        if new_cells[i] == GOAL_CELL:
+            zobrist ^= level.zobrist_goals[i]
+            if mirror is not None:
+                mirror ^= level.mirror_goals[i]
+        new_cells[i] = piece
+    
+    pieces = dict(board.pieces)
+    pieces[piece] = new_piece_cells
         
-    return new_board
+    return Board(level, bytes(new_cells), pieces, zobrist, mirror)
 
 def parse_move(move_str):
     move_str = move_str.strip('()')
     piece, direction = move_str.split(',')
     return (int(piece), direction.strip().upper()) 
 
-def find_piece_coordinates(board, piece):
-    coords = []
-    for i in range(ROWS):
-        row = board[i]
-        for j in range(COLS):
-            if int(row[j]) == piece:
-                coords.append((j, i))
-    return coords
-
-def is_valid_move(board, piece_coords, direction, piece):
-    dx, dy = DIRECTIONS[direction]
-    new_coords = [(x + dx, y + dy) for x, y in piece_coords]
-    
-    current_piece_coords = set((x, y) for x, y in piece_coords)
+def cell_value(level, board, x, y):
+    value = board.cells[y * level.cols + x]
+    return GOAL if value == GOAL_CELL else value
+
+def find_piece_cells(board, piece):
+    return board.pieces.get(piece, ())
+
+def find_piece_coordinates(level, piece_cells):
+    return [(i % level.cols, i // level.cols) for i in piece_cells]
+
+def in_bounds(level, i, direction):
+    match direction:
+        case "UP":
+            return i >= level.cols
+        case "DOWN":
+            return i < (level.rows - 1) * level.cols
+        case "LEFT":
+            return i % level.cols != 0
+        case "RIGHT":
+            return i % level.cols != level.cols - 1
+
+def is_valid_move(level, board, piece_cells, direction, piece):
+    offset = level.offsets[direction]
+    cells = board.cells
     
-    for x, y in new_coords:
-        if x < 0 or x >= COLS or y < 0 or y >= ROWS:
+    for i in piece_cells:
+        if not in_bounds(level, i, direction):
             return False
-            
-        if (x, y) in current_piece_coords:
+        
+        value = cells[i + offset]
+        if value == piece or value == EMPTY_CELL:
             continue
             
-        if int(board[y][x]) == WALL:
-            return False
-        
-        cell_value = int(board[y][x])
-        if cell_value != EMPTY_CELL:
-            if piece == 2 and cell_value == GOAL:
-                continue
-            return False
+        if value == GOAL_CELL and piece == 2:
+            continue
+        return False
     return True
 
-def get_new_coords(piece_coords, direction):
-    dx, dy = DIRECTIONS[direction]
-    return [(x + dx, y + dy) for x, y in piece_coords]
-
-def get_specific_piece_moves(board, piece):
+def get_specific_piece_moves(level, board, piece):
     moves = []
-    coords = find_piece_coordinates(board, piece)
+    piece_cells = find_piece_cells(board, piece)
     for direction in DIRECTIONS:
-        if is_valid_move(board, coords, direction, piece):
+        if is_valid_move(level, board, piece_cells, direction, piece):
             moves.append((piece, direction))
     
     return moves
 
-def get_available_moves(board):
+def get_available_moves(level, board):
     moves = []
-    pieces = sorted(set(int(cell) for row in board 
-                   for cell in row 
-                   if int(cell) != EMPTY_CELL and int(cell) != WALL and int(cell) != GOAL))
+    directions = ["UP", "RIGHT", "DOWN", "LEFT"]
 
-    for piece in pieces:
-        piece_moves = []
-        directions = ["UP", "RIGHT", "DOWN", "LEFT"]
+    for piece, piece_cells in board.pieces.items():
         for direction in directions:
-            coords = find_piece_coordinates(board, piece)
-            if is_valid_move(board, coords, direction, piece):
-                piece_moves.append((piece, direction))
-        moves.extend(piece_moves)
+            if is_valid_move(level, board, piece_cells, direction, piece):
+                moves.append((piece, direction))
     
     return moves
 
 def check_solution(board):
-    for row in board:
-        for cell in row:
-            if int(cell) == GOAL:
-                return False
-    return True
+    return GOAL_CELL not in board.cells
 
-def print_board(board):
-    print(str(COLS) + ", " + str(ROWS))
-    for row in board:
-        print(' ' + ', '.join(f"{int(cell):2d}" for cell in row))
+def print_board(level, board):
+    print(str(level.cols) + ", " + str(level.rows))
+    for i in range(level.rows):
+        print(' ' + ', '.join(f"{cell_value(level, board, j, i):2d}" for j in range(level.cols)))
 
 def load_board(filename):
-    global ROWS, COLS
     try:
         with open(filename, 'r') as file:
             lines = file.readlines()
-            
-            dimensions = [int(x) for x in lines[0].strip().split(',') if x]
-            COLS, ROWS = dimensions[0], dimensions[1]
-            board = []
-            for line in lines[1:]:
-                row = [int(cell) for cell in line.strip().split(',') if cell]
-                board.append(row)
-            return board
-            
     except FileNotFoundError:
         print(f"Error: Could not find file '{filename}'")
         sys.exit(1)
     except IOError:
         print(f"Error: Could not read file '{filename}'")
         sys.exit(1)
-        
-def calculate_heuristic(board):
-    goal_position = None
-    for i in range(ROWS):
-        for j in range(COLS):
-            if int(board[i][j]) == GOAL:
-                goal_position = (j, i)
-                break
-        if goal_position:
-            break
-    
-    if not goal_position:
+    return parse_board(lines, filename)
+
+def parse_board(lines, source):
+    dimensions = [int(x) for x in lines[0].strip().split(',') if x]
+    cols, rows = dimensions[0], dimensions[1]
+    board = bytearray()
+    for line in lines[1:]:
+        for cell in line.strip().split(','):
+            if not cell:
+                continue
+            value = int(cell)
+            if value < GOAL or value >= GOAL_CELL:
+                print(f"Error: Invalid cell value {value} in '{source}'")
+                sys.exit(1)
+            board.append(value & 0xFF)
+    if len(board) != rows * cols:
+        print(f"Error: Board in '{source}' does not match its dimensions")
+        sys.exit(1)
+    board = bytes(board)
+    level = get_level(cols, rows, board)
+    return level, Board(level, board)
+
+def get_level(cols, rows, cells):
+    # Levels are shared by every board with the same walls, goal and piece
+    # shapes, which keeps their tables warm across loads of the same puzzle.
+    key = (cols, rows, static_layout(cells), shape_signature(cols, index_pieces(cells)))
+    if key not in LEVELS:
+        LEVELS[key] = Level(cols, rows, cells)
+    return LEVELS[key]
+
+def shape_signature(cols, pieces):
+    shapes = []
+    for piece, piece_cells in pieces.items():
+        anchor = piece_cells[0]
+        shapes.append((piece == 2, tuple(((i % cols) - (anchor % cols), (i // cols) - (anchor // cols)) for i in piece_cells)))
+    return tuple(sorted(shapes))
+
+def build_distance_fields(level, master_cells):
+    # Moves needed to get the master piece onto each goal cell from every
+    # placement, looking only at the walls. A goal cell is done once the
+    # master has covered it, so the cells need not be covered all at once
+    # and each gets a field of its own. Placements are keyed by the first
+    # cell the master piece covers.
+    cols, rows = level.cols, level.rows
+    goal_cells = [i for i, value in enumerate(level.layout) if value == GOAL_CELL]
+    master_coords = find_piece_coordinates(level, master_cells)
+    if not master_coords:
+        return []
+
+    anchor_x, anchor_y = master_coords[0]
+    footprint = [(x - anchor_x, y - anchor_y) for x, y in master_coords]
+
+    def placement(x, y):
+        piece_cells = []
+        for dx, dy in footprint:
+            if x + dx < 0 or x + dx >= cols or y + dy < 0 or y + dy >= rows:
+                return None
+            i = (y + dy) * cols + x + dx
+            if level.layout[i] == WALL:
+                return None
+            piece_cells.append(i)
+        return piece_cells
+
+    fields = []
+    for goal in goal_cells:
+        distances = [float('inf')] * (rows * cols)
+        frontier = deque()
+        for y in range(rows):
+            for x in range(cols):
+                piece_cells = placement(x, y)
+                if piece_cells is not None and goal in piece_cells:
+                    distances[y * cols + x] = 0
+                    frontier.append((x, y))
+
+        while frontier:
+            x, y = frontier.popleft()
+            distance = distances[y * cols + x] + 1
+            for dx, dy in DIRECTIONS.values():
+                if placement(x + dx, y + dy) is None:
+                    continue
+                i = (y + dy) * cols + x + dx
+                if distances[i] > distance:
+                    distances[i] = distance
+                    frontier.append((x + dx, y + dy))
+        fields.append((goal, distances))
+    return fields
+
+def calculate_heuristic(level, board):
+    if GOAL_CELL not in board.cells:
         return 0 
     
-    piece_coords = find_piece_coordinates(board, 2)
-    if not piece_coords:
+    master_cells = find_piece_cells(board, 2)
+    if not master_cells:
         print("Error: No piece 2 found")
         sys.exit(1)
     
-    min_distance = float('inf')
-    for coord in piece_coords:
-        distance = calculate_manhattan_distance(
-            coord[0], coord[1],
-            goal_position[0], goal_position[1]
-        )
-        #print("DISTANCE: " + str(distance))
-        min_distance = min(min_distance, distance)
-    
-    return min_distance
+    # Every goal cell not yet covered still has to be reached.
+    distance = 0
+    for goal, distances in level.distance_fields:
+        if board.cells[goal] == GOAL_CELL and distances[master_cells[0]] > distance:
+            distance = distances[master_cells[0]]
+    for database in level.pattern_databases:
+        if any(board.cells[goal] == GOAL_CELL for goal in database.goals):
+            distance = max(distance, database.lookup(board))
+    return distance
+
+class PatternDatabase:
+    # Exact distances until the master piece covers one of goals, for an
+    # abstraction of the board that keeps the master piece plus count
+    # pieces of each of a few blocker shapes and empties the rest. Pieces of
+    # one shape are interchangeable, so an abstract state is the sorted
+    # placements of each shape and is ranked combinatorially.
+    def __init__(self, level, classes, goals, table=None):
+        self.layout = level.layout
+        self.classes = classes
+        self.goals = goals
+        placements, anchors = find_placements(level, classes[0][0], ())
+        self.placements = [placements]
+        self.anchors = [anchors]
+        barred = barred_cells(level, placements, goals[0])
+        for footprint, _ in classes[1:]:
+            placements, anchors = find_placements(level, footprint, barred)
+            self.placements.append(placements)
+            self.anchors.append(anchors)
+        self.sizes = [comb(len(placements), count) for placements, (_, count) in zip(self.placements, classes)]
+        self.size = 1
+        for size in self.sizes:
+            self.size *= size
+        max_count = max(count for _, count in classes)
+        self.binomial = [[comb(n, k) for k in range(max_count + 1)] for n in range(len(self.layout) + 1)]
+        self.master_lookup = {piece_cells: p for p, piece_cells in enumerate(self.placements[0])}
+        self.blocker_lookup = {}
+        for c in range(1, len(classes)):
+            for p, piece_cells in enumerate(self.placements[c]):
+                self.blocker_lookup[piece_cells] = (c, p)
+        self.table = table
+
+    def rank(self, groups):
+        index = 0
+        for group, size in zip(groups, self.sizes):
+            rank = 0
+            for k, p in enumerate(group, 1):
+                rank += self.binomial[p][k]
+            index = index * size + rank
+        return index
+
+    def lookup(self, board):
+        groups = [[self.master_lookup[board.pieces[2]]]] + [[] for _ in self.classes[1:]]
+        for piece, piece_cells in board.pieces.items():
+            entry = self.blocker_lookup.get(piece_cells)
+            if entry is not None and piece != 2:
+                groups[entry[0]].append(entry[1])
+        # When a class keeps fewer pieces than the board has of its shape,
+        # every choice of count of them is a relaxation of the board, so the
+        # largest of their distances is still a lower bound.
+        best = 0
+        for groups in product(*(combinations(sorted(group), count) for group, (_, count) in zip(groups, self.classes))):
+            value = self.table[self.rank(groups)]
+            if value == PDB_UNKNOWN:
+                return float('inf')
+            best = max(best, value)
+        return best
+
+def static_layout(cells):
+    return bytes(value if value == WALL or value == GOAL_CELL else EMPTY_CELL for value in cells)
+
+def piece_footprint(level, board, piece):
+    piece_cells = find_piece_cells(board, piece)
+    if not piece_cells:
+        print(f"Error: No piece {piece} found")
+        sys.exit(1)
+    coords = find_piece_coordinates(level, piece_cells)
+    anchor_x, anchor_y = coords[0]
+    return tuple((x - anchor_x, y - anchor_y) for x, y in coords)
+
+def find_placements(level, footprint, barred):
+    cols, rows, layout = level.cols, level.rows, level.layout
+    placements = []
+    anchors = {}
+    for y in range(rows):
+        for x in range(cols):
+            piece_cells = []
+            for dx, dy in footprint:
+                if x + dx < 0 or x + dx >= cols or y + dy < 0 or y + dy >= rows:
+                    break
+                i = (y + dy) * cols + x + dx
+                if layout[i] == WALL or i in barred:
+                    break
+                piece_cells.append(i)
+            else:
+                anchors[(x, y)] = len(placements)
+                placements.append(tuple(piece_cells))
+    return placements, anchors
+
+def count_shapes(level, board):
+    shapes = {}
+    for piece in board.pieces:
+        if piece != 2:
+            footprint = piece_footprint(level, board, piece)
+            shapes[footprint] = shapes.get(footprint, 0) + 1
+    return shapes
+
+def barred_cells(level, master_placements, goal):
+    # Goal cells a blocker cannot be on while goal is still uncovered: the
+    # master covers each of them only together with goal, if at all, so none
+    # of them has been cleared yet. Blockers may use the other goal cells.
+    goal_cells = [i for i, value in enumerate(level.layout) if value == GOAL_CELL]
+    return {cell for cell in goal_cells
+            if all(goal in piece_cells for piece_cells in master_placements if cell in piece_cells)}
+
+def pattern_classes(level, board, limit, barred):
+    master = piece_footprint(level, board, 2)
+    classes = [(master, 1)]
+    size = len(find_placements(level, master, ())[0])
+    # Biggest shapes first: they get in the master piece's way the most and
+    # have the fewest placements. A shape with too many pieces to fit keeps
+    # as many of them as do.
+    for footprint, count in sorted(count_shapes(level, board).items(), key=lambda item: (-len(item[0]), item[1])):
+        placements = len(find_placements(level, footprint, barred)[0])
+        while count and size * comb(placements, count) > limit:
+            count -= 1
+        if count:
+            classes.append((footprint, count))
+            size *= comb(placements, count)
+    return classes
+
+def goal_states(database):
+    goal = database.goals[0]
+    states = []
+
+    def place(groups, group, start, occupied):
+        c = len(groups)
+        if c == len(database.classes):
+            states.append(tuple(groups))
+        elif len(group) == database.classes[c][1]:
+            place(groups + [tuple(group)], [], 0, occupied)
+        else:
+            for p in range(start, len(database.placements[c])):
+                piece_cells = database.placements[c][p]
+                if occupied.isdisjoint(piece_cells):
+                    place(groups, group + [p], p + 1, occupied.union(piece_cells))
+
+    for p, piece_cells in enumerate(database.placements[0]):
+        if goal in piece_cells:
+            place([(p,)], [], 0, set(piece_cells))
+    return states
+
+def build_pattern_databases(level, board, limit=PDB_LIMIT):
+    # A goal cell is done once the master has covered it, so there is one
+    # database per goal cell, like the distance fields. Goal cells that would
+    # get the same table share one.
+    placements = find_placements(level, piece_footprint(level, board, 2), ())[0]
+    groups = {}
+    for goal in (i for i, value in enumerate(level.layout) if value == GOAL_CELL):
+        barred = barred_cells(level, placements, goal)
+        key = (frozenset(barred), tuple(piece_cells for piece_cells in placements if goal in piece_cells))
+        groups.setdefault(key, (barred, []))[1].append(goal)
+    return [build_pattern_database(level, board, goals, barred, limit) for barred, goals in groups.values()]
+
+def build_pattern_database(level, board, goals, barred, limit):
+    database = PatternDatabase(level, pattern_classes(level, board, limit, barred), goals)
+    table = array('B', [PDB_UNKNOWN]) * database.size
+    coords = [{p: anchor for anchor, p in anchors.items()} for anchors in database.anchors]
 
-def calculate_manhattan_distance(x1, y1, x2, y2):
-    return abs(x1 - x2) + abs(y1 - y2)
+    # Every abstract move can be undone, so a forward BFS from the goal
+    # states gives the same distances as searching backwards.
+    frontier = deque()
+    for state in goal_states(database):
+        index = database.rank(state)
+        if table[index] == PDB_UNKNOWN:
+            table[index] = 0
+            frontier.append((state, 0))
 
-def search(board, data_structure, depth_limit=None):
+    while frontier:
+        state, distance = frontier.popleft()
+        distance = min(distance + 1, PDB_UNKNOWN - 1)
+        occupied = set()
+        for c, group in enumerate(state):
+            for p in group:
+                occupied.update(database.placements[c][p])
+        for c, group in enumerate(state):
+            for k, p in enumerate(group):
+                x, y = coords[c][p]
+                piece_cells = database.placements[c][p]
+                for dx, dy in DIRECTIONS.values():
+                    q = database.anchors[c].get((x + dx, y + dy))
+                    if q is None:
+                        continue
+                    if any(i in occupied and i not in piece_cells for i in database.placements[c][q]):
+                        continue
+                    new_group = tuple(sorted(group[:k] + (q,) + group[k + 1:]))
+                    new_state = state[:c] + (new_group,) + state[c + 1:]
+                    index = database.rank(new_state)
+                    if table[index] == PDB_UNKNOWN:
+                        table[index] = distance
+                        frontier.append((new_state, distance))
+    database.table = table
+    return database
+
+def pattern_database_filename(filename):
+    return os.path.splitext(filename)[0] + ".pdb"
+
+def save_pattern_databases(level, databases, filename):
+    # A JSON header line, then the tables one after another in header order.
+    header = {
+        "cols": level.cols,
+        "rows": level.rows,
+        "layout": list(level.layout),
+        "databases": [{"goals": database.goals,
+                       "classes": [[[list(cell) for cell in footprint], count] for footprint, count in database.classes]}
+                      for database in databases]
+    }
+    try:
+        with open(filename, 'wb') as file:
+            file.write(json.dumps(header).encode() + b"\n")
+            for database in databases:
+                database.table.tofile(file)
+    except IOError:
+        print(f"Error: Could not write file '{filename}'")
+        sys.exit(1)
+
+def load_pattern_databases(level, filename, board):
+    try:
+        with open(filename, 'rb') as file:
+            header = json.loads(file.readline())
+            table = array('B')
+            table.frombytes(file.read())
+    except FileNotFoundError:
+        print(f"Error: Could not find file '{filename}'")
+        sys.exit(1)
+    except (IOError, ValueError):
+        print(f"Error: Could not read file '{filename}'")
+        sys.exit(1)
+
+    if "databases" not in header:
+        print(f"Error: Pattern database '{filename}' is out of date; rebuild it with the pdb command")
+        sys.exit(1)
+    if header.get("cols") != level.cols or header.get("rows") != level.rows or bytes(header.get("layout", ())) != level.layout:
+        print(f"Error: Pattern database '{filename}' does not match this board")
+        sys.exit(1)
+    master = piece_footprint(level, board, 2)
+    shapes = count_shapes(level, board)
+    databases = []
+    offset = 0
+    for entry in header["databases"]:
+        classes = [(tuple(tuple(cell) for cell in footprint), count) for footprint, count in entry["classes"]]
+        if (classes[0][0] != master or not entry["goals"]
+                or any(goal not in range(len(level.layout)) or level.layout[goal] != GOAL_CELL for goal in entry["goals"])
+                or any(shapes.get(footprint, 0) < count for footprint, count in classes[1:])):
+            print(f"Error: Pattern database '{filename}' does not match this board")
+            sys.exit(1)
+        database = PatternDatabase(level, classes, entry["goals"])
+        database.table = table[offset:offset + database.size]
+        offset += database.size
+        databases.append(database)
+    if offset != len(table):
+        print(f"Error: Pattern database '{filename}' is truncated")
+        sys.exit(1)
+    return databases
+
+def use_pattern_database(level, filename, board):
+    # The database belongs to the level file, not to the Level shared by
+    # every board with the same layout, so it goes on a copy of the Level
+    # that is kept per database file. Boards given without a level file are
+    # searched without one.
+    if filename is None:
+        return level
+    pdb_filename = pattern_database_filename(filename)
+    if not os.path.exists(pdb_filename):
+        return level
+    key = (level, os.path.getmtime(pdb_filename))
+    if pdb_filename not in PATTERN_LEVELS or PATTERN_LEVELS[pdb_filename][0] != key:
+        pattern_level = copy.copy(level)
+        pattern_level.pattern_databases = load_pattern_databases(level, pdb_filename, board)
+        PATTERN_LEVELS[pdb_filename] = (key, pattern_level)
+    return PATTERN_LEVELS[pdb_filename][1]
+
+class Node:
+    __slots__ = ("board", "parent", "move", "depth")
+
+    def __init__(self, board, parent=None, move=None):
+        self.board = board
+        self.parent = parent
+        self.move = move
+        self.depth = parent.depth + 1 if parent is not None else 0
+
+def get_path(node):
+    moves = []
+    while node.parent is not None:
+        moves.append(node.move)
+        node = node.parent
+    moves.reverse()
+    return moves
+
+class SearchResult:
+    __slots__ = ("moves", "board", "nodes_explored", "elapsed")
+
+    def __init__(self, moves, board, nodes_explored, elapsed):
+        # moves and board are None when there is no solution.
+        self.moves = moves
+        self.board = board
+        self.nodes_explored = nodes_explored
+        self.elapsed = elapsed
+
+def print_result(level, result):
+    if result.moves is None:
+        print_no_solution(result.nodes_explored, result.elapsed)
+    else:
+        print_solution(level, result.moves, result.board, result.nodes_explored, result.elapsed)
+
+def print_solution(level, moves, board, nodes_explored, elapsed):
+    for piece, direction in moves:
+        print(f"({piece},{direction})")
+    print()
+    print_board(level, board)
+    print()
+    print(nodes_explored)
+    print(f"{elapsed:.2f}")
+    print(len(moves))
+
+def print_no_solution(nodes_explored, elapsed):
+    print(nodes_explored)
+    print(f"{elapsed:.2f}")
+    print("No solution found")
+
+class SearchStats:
+    # Counters a search fills in when it is given one. Generated counts every
+    # child built, duplicates the children and popped entries skipped as
+    # already seen, and layers the boards expanded at each depth.
+    __slots__ = ("generated", "expanded", "duplicates", "peak_frontier", "peak_visited", "layers",
+                 "samples", "heuristic_calls", "heuristic_time", "iterations", "start_time", "memory_peak")
+
+    def __init__(self):
+        self.generated = 0
+        self.expanded = 0
+        self.duplicates = 0
+        self.peak_frontier = 0
+        self.peak_visited = 0
+        self.layers = {}
+        self.samples = []
+        self.heuristic_calls = 0
+        self.heuristic_time = 0.0
+        self.iterations = 0
+        self.start_time = time.perf_counter()
+        self.memory_peak = None
+
+    def expand(self, depth, frontier, visited):
+        self.expanded += 1
+        self.layers[depth] = self.layers.get(depth, 0) + 1
+        if frontier > self.peak_frontier:
+            self.peak_frontier = frontier
+        if visited > self.peak_visited:
+            self.peak_visited = visited
+        if self.expanded % STATS_INTERVAL == 0:
+            self.samples.append((time.perf_counter() - self.start_time, self.expanded))
+
+    def heuristic(self, function, level, board):
+        start = time.perf_counter()
+        value = function(level, board)
+        self.heuristic_time += time.perf_counter() - start
+        self.heuristic_calls += 1
+        return value
+
+    def to_dict(self, result):
+        elapsed = time.perf_counter() - self.start_time
+        rates = []
+        previous_time, previous_expanded = 0.0, 0
+        for sample_time, expanded in self.samples + [(elapsed, self.expanded)]:
+            if sample_time > previous_time:
+                rates.append([round(sample_time, 3), round((expanded - previous_expanded) / (sample_time - previous_time))])
+            previous_time, previous_expanded = sample_time, expanded
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {
+            "solved": result.moves is not None,
+            "length": None if result.moves is None else len(result.moves),
+            "nodes_explored": result.nodes_explored,
+            "elapsed": round(result.elapsed, 4),
+            "generated": self.generated,
+            "expanded": self.expanded,
+            "duplicates": self.duplicates,
+            "peak_frontier": self.peak_frontier,
+            "peak_visited": self.peak_visited,
+            "iterations": self.iterations,
+            "layers": [self.layers.get(depth, 0) for depth in range(max(self.layers, default=-1) + 1)],
+            "nodes_per_second": rates,
+            "heuristic_calls": self.heuristic_calls,
+            "heuristic_time": round(self.heuristic_time, 4),
+            # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+            "max_rss_bytes": max_rss if sys.platform == "darwin" else max_rss * 1024,
+            "tracemalloc_peak_bytes": self.memory_peak
+        }
+
+class SolutionCache:
+    # Solved boards in a sqlite file, keyed by the dimensions and normalized
+    # cells of the start board plus the algorithm. Least recently used rows
+    # are evicted once the stored rows exceed limit bytes. Searches may run
+    # in several threads at once, so they share the connection under a lock.
+    def __init__(self, filename, limit):
+        import sqlite3
+        import threading
+        self.limit = limit
+        self.lock = threading.Lock()
+        try:
+            self.connection = sqlite3.connect(filename, check_same_thread=False)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS solutions ("
+                "key BLOB, algorithm TEXT, moves TEXT, end_board BLOB, nodes INTEGER, "
+                "elapsed REAL, size INTEGER, last_used REAL, PRIMARY KEY (key, algorithm))")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS solutions_last_used ON solutions (last_used)")
+            self.connection.commit()
+        except sqlite3.Error:
+            print(f"Error: Could not open cache '{filename}'")
+            sys.exit(1)
+
+    def key(self, level, board):
+        return bytes((level.cols, level.rows)) + board.cells
+
+    def get(self, level, board, algorithm):
+        key = self.key(level, board)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT moves, end_board, nodes, elapsed FROM solutions WHERE key = ? AND algorithm = ?",
+                (key, algorithm)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute(
+                "UPDATE solutions SET last_used = ? WHERE key = ? AND algorithm = ?", (time.time(), key, algorithm))
+            self.connection.commit()
+        moves, end_board, nodes_explored, elapsed = row
+        return [tuple(move) for move in json.loads(moves)], Board(level, end_board), nodes_explored, elapsed
+
+    def put(self, level, boards, algorithm, moves, end_board, nodes_explored, elapsed):
+        # boards[i] is the board moves[i] is played on, so every suffix of the
+        # move list is a solution for the matching board.
+        now = time.time()
+        rows = []
+        for i, board in enumerate(boards):
+            key = self.key(level, board)
+            suffix = json.dumps(moves[i:])
+            rows.append((key, algorithm, suffix, end_board.cells, nodes_explored, elapsed,
+                         len(key) + len(suffix) + len(end_board.cells), now))
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO solutions VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.evict()
+            self.connection.commit()
+
+    def evict(self):
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM solutions").fetchone()[0]
+        if total <= self.limit:
+            return
+        evicted = []
+        for rowid, size in self.connection.execute("SELECT rowid, size FROM solutions ORDER BY last_used"):
+            if total <= self.limit:
+                break
+            evicted.append((rowid,))
+            total -= size
+        self.connection.executemany("DELETE FROM solutions WHERE rowid = ?", evicted)
+
+def use_solution_cache(options):
+    global SOLUTION_CACHE
+    if "cache" not in options:
+        return
+    try:
+        megabytes = int(options.get("cache-size", CACHE_SIZE_MB))
+    except ValueError:
+        megabytes = 0
+    if megabytes < 1:
+        print("Error: --cache-size must be a positive number of megabytes")
+        sys.exit(1)
+    SOLUTION_CACHE = SolutionCache(options["cache"], megabytes << 20)
+
+def cached_solution(level, board, algorithm):
+    if SOLUTION_CACHE is None or not isinstance(board, Board):
+        return None
+    cached = SOLUTION_CACHE.get(level, board, algorithm)
+    if cached is None:
+        return None
+    return SearchResult(*cached)
+
+def finish_search(level, board, algorithm, moves, end_board, nodes_explored, start_time):
+    result = SearchResult(moves, end_board, nodes_explored, time.time() - start_time)
+    if SOLUTION_CACHE is None or not isinstance(board, Board):
+        return result
+    boards = [board]
+    if algorithm in OPTIMAL_ALGORITHMS:
+        for move in moves[:-1]:
+            boards.append(normalize_board(level, apply_move(level, boards[-1], move)))
+    SOLUTION_CACHE.put(level, boards, algorithm, moves, end_board, nodes_explored, result.elapsed)
+    return result
+
+def search(level, board, data_structure, engine=None, stats=None):
+    # engine is a module providing the board functions; it defaults to the
+    # bytes boards in this file (see bitboard.py for the alternative), and
+    # level must come from the same engine.
+    if engine is None:
+        engine = sys.modules[__name__]
     start_time = time.time()
     nodes_explored = 0
-    board = normalize_board(board)
-    inital = calculate_heuristic(board)
-    current_depth = 1 if depth_limit is not None else None
+    board = engine.normalize_board(level, board)
+    algorithm = ALGORITHM_NAMES.get(type(data_structure))
+    cached = cached_solution(level, board, algorithm)
+    if cached is not None:
+        return cached
+    if stats is not None:
+        stats.iterations = 1
+        inital = stats.heuristic(engine.calculate_heuristic, level, board)
+    else:
+        inital = engine.calculate_heuristic(level, board)
 
-    while True:
-        data_structure.push([board, []], inital)
-        visited = set()
-        while not data_structure.is_empty():
-            result = data_structure.pop()
-            if isinstance(result, tuple) and len(result) == 2:
-                current_board = result[0][0]
-                current_moves = result[0][1]
-                priority = result[1]
+    data_structure.push(Node(board), inital)
+    # Cheapest known path length to every generated board. Children are
+    # checked against it before they are pushed, and entries left behind by
+    # a cheaper path are skipped when they are popped.
+    best_g = {board.key: 0}
+    closed = set()
+    while not data_structure.is_empty():
+        result = data_structure.pop()
+        if isinstance(result, tuple) and len(result) == 2:
+            node, priority = result
+        else:
+            node = result
+            priority = None
+        current_board = node.board
+        #print(f"Current board: {current_board}")
+
+        if current_board.key in closed or node.depth > best_g[current_board.key]:
+            #print("Skipping - already visited")
+            if stats is not None:
+                stats.duplicates += 1
+            continue
+            
+        if engine.check_solution(current_board):
+            #print("\nSOLUTION FOUND!")
+            return finish_search(level, board, algorithm, get_path(node), current_board, nodes_explored, start_time)
+            
+        closed.add(current_board.key)
+        nodes_explored += 1
+        if stats is not None:
+            stats.expand(node.depth, data_structure.size(), len(best_g))
+        
+        new_g = node.depth + 1
+        available_moves = engine.get_available_moves(level, current_board)
+        for move in available_moves:
+            new_board = engine.apply_move(level, current_board, move)
+            if stats is not None:
+                stats.generated += 1
+            if new_board.key in closed or best_g.get(new_board.key, new_g + 1) <= new_g:
+                if stats is not None:
+                    stats.duplicates += 1
+                continue
+            best_g[new_board.key] = new_g
+            new_board = engine.normalize_board(level, new_board)
+            if priority is None:
+                new_f = None
+            elif stats is not None:
+                new_f = new_g + stats.heuristic(engine.calculate_heuristic, level, new_board)
             else:
-                current_board, current_moves = result
-                priority = None
-            #print(f"Current board: {current_board}")
-            #print(f"Current moves: {current_moves}")
-            current_depth_of_node = len(current_moves)
-                
-            if check_solution(current_board):
-                #print("\nSOLUTION FOUND!")
-                end_time = time.time()
-                solution_length = len(current_moves)
-                for piece, direction in current_moves:
-                    print(f"({piece},{direction})")
-                print()
-                print_board(current_board)
-                print()
-                print(nodes_explored)
-                print(f"{(end_time - start_time):.2f}")
-                print(solution_length)
-                return
+                new_f = new_g + engine.calculate_heuristic(level, new_board)
+            data_structure.push(Node(new_board, node, move), new_f)
+    
+    return SearchResult(None, None, nodes_explored, time.time() - start_time)
 
-            if depth_limit is not None and len(current_moves) >= current_depth:
-                #print(f"Skipping - reached depth limit {current_depth}")
+def deepening_search(level, board, algorithm, estimate, stats=None):
+    # Depth-first passes shared by IDS and IDA*: a board is skipped when its
+    # depth plus estimate is over the bound, and each pass raises the bound
+    # to the smallest value skipped in the one before.
+    start_time = time.time()
+    nodes_explored = 0
+    board = normalize_board(level, board)
+    root = Node(board)
+    cached = cached_solution(level, board, algorithm)
+    if cached is not None:
+        return cached
+    if check_solution(board):
+        return finish_search(level, board, algorithm, [], board, nodes_explored, start_time)
+
+    bound = estimate(level, board)
+    while True:
+        # Small transposition table: shallowest depth per board in this
+        # iteration, capped at TABLE_LIMIT entries.
+        shallowest = {board.key: 0}
+        next_bound = None
+        nodes_explored += 1
+        if stats is not None:
+            stats.iterations += 1
+            stats.expand(0, 0, 1)
+        stack = [(root, iter(get_available_moves(level, board)))]
+        while stack:
+            node, moves = stack[-1]
+            move = next(moves, None)
+            if move is None:
+                stack.pop()
                 continue
 
-            board_tuple = tuple(tuple(int(cell) for cell in row) for row in current_board)
-            if board_tuple in visited:
-                #print("Skipping - already visited")
+            new_board = apply_move(level, node.board, move)
+            depth = node.depth + 1
+            if stats is not None:
+                stats.generated += 1
+            if shallowest.get(new_board.key, depth + 1) <= depth:
+                if stats is not None:
+                    stats.duplicates += 1
                 continue
-                
-            visited.add(board_tuple)
-            if depth_limit is None or len(current_moves) + 1 == current_depth:
-                nodes_explored += 1
-            
-            available_moves = get_available_moves(current_board)
-            for move in available_moves:
-                new_board = [row[:] for row in current_board]
-                new_board = apply_move(new_board, move)
-                new_board = normalize_board(new_board)
-                if priority is not None:
-                    new_priority = priority + 1
-                    new_h = calculate_heuristic(new_board)
-                    new_f = new_priority + new_h
+            new_board = normalize_board(level, new_board)
+            f = depth + estimate(level, new_board)
+            if f > bound:
+                if next_bound is None or f < next_bound:
+                    next_bound = f
+                continue
+            if len(shallowest) < TABLE_LIMIT or new_board.key in shallowest:
+                shallowest[new_board.key] = depth
+            child = Node(new_board, node, move)
+
+            if check_solution(new_board):
+                return finish_search(level, board, algorithm, get_path(child), new_board, nodes_explored, start_time)
+
+            nodes_explored += 1
+            if stats is not None:
+                stats.expand(depth, len(stack), len(shallowest))
+            stack.append((child, iter(get_available_moves(level, new_board))))
+
+        if next_bound is None:
+            return SearchResult(None, None, nodes_explored, time.time() - start_time)
+        bound = next_bound
+
+def solved_estimate(level, board):
+    # Makes deepening_search plain IDS: boards at the depth limit are still
+    # checked for a solution but never expanded, and the limit grows by one.
+    return 0 if check_solution(board) else 1
+
+def iterative_deepening(level, board, stats=None):
+    return deepening_search(level, board, "ids", solved_estimate, stats)
+
+def ida_star(level, board, stats=None):
+    heuristic = calculate_heuristic if stats is None else partial(stats.heuristic, calculate_heuristic)
+    return deepening_search(level, board, "idastar", heuristic, stats)
+
+def beam_search(level, board, width):
+    # Goes one depth at a time like BFS but keeps only the width boards with
+    # the lowest heuristic at each depth, so memory is bounded by width and
+    # TABLE_LIMIT. The solution found may be longer than the shortest one,
+    # and a solvable board may be reported unsolved.
+    start_time = time.time()
+    nodes_explored = 0
+    board = normalize_board(level, board)
+    algorithm = f"beam-{width}"
+    cached = cached_solution(level, board, algorithm)
+    if cached is not None:
+        return cached
+    if check_solution(board):
+        return finish_search(level, board, algorithm, [], board, nodes_explored, start_time)
+
+    # Boards seen at any depth, until the table is full; after that only
+    # boards of the last two depths are checked and the search gives up.
+    seen = {board.key}
+    previous = set()
+    layer = [Node(board)]
+    while layer and len(seen) < TABLE_LIMIT:
+        current = set()
+        children = []
+        for node in layer:
+            nodes_explored += 1
+            for move in get_available_moves(level, node.board):
+                new_board = apply_move(level, node.board, move)
+                key = new_board.key
+                if key in seen or key in previous or key in current:
+                    continue
+                seen.add(key)
+                current.add(key)
+                child = Node(normalize_board(level, new_board), node, move)
+                if check_solution(child.board):
+                    return finish_search(level, board, algorithm, get_path(child), child.board, nodes_explored, start_time)
+                children.append((calculate_heuristic(level, child.board), len(children), child))
+        previous = current
+        layer = [child for _, _, child in heapq.nsmallest(width, children)]
+    return SearchResult(None, None, nodes_explored, time.time() - start_time)
+
+def anytime_search(level, board, deadline, weight, report=None):
+    # Anytime repairing A*: weighted A* with f = g + weight * h finds a first
+    # solution quickly, then weight is lowered towards 1 and the search goes
+    # on from the same open list and g-values. Every shorter solution is
+    # passed to report as it is found. Ends at the deadline, or once
+    # weight is 1 and nothing left on the open list can beat the best.
+    start_time = time.time()
+    nodes_explored = 0
+    board = normalize_board(level, board)
+    if check_solution(board):
+        return SearchResult([], board, nodes_explored, time.time() - start_time)
+
+    heuristics = {}
+
+    def heuristic(node_board):
+        if node_board.key not in heuristics:
+            heuristics[node_board.key] = calculate_heuristic(level, node_board)
+        return heuristics[node_board.key]
+
+    best = SearchResult(None, None, nodes_explored, 0)
+    best_g = {board.key: 0}
+    open_list = PriorityQueue()
+    open_list.push(Node(board), weight * heuristic(board))
+    while True:
+        # Boards expanded with this weight; a cheaper path to one of them
+        # is parked in inconsistent until the weight is lowered.
+        closed = set()
+        inconsistent = []
+        goal = None
+        while not open_list.is_empty() and time.time() < deadline:
+            node, _ = open_list.pop()
+            key = node.board.key
+            if key in closed or node.depth > best_g[key]:
+                continue
+            if best.moves is not None and node.depth + heuristic(node.board) >= len(best.moves):
+                continue
+            if check_solution(node.board):
+                goal = node
+                break
+
+            closed.add(key)
+            nodes_explored += 1
+            new_g = node.depth + 1
+            for move in get_available_moves(level, node.board):
+                new_board = apply_move(level, node.board, move)
+                if best_g.get(new_board.key, new_g + 1) <= new_g:
+                    continue
+                best_g[new_board.key] = new_g
+                child = Node(normalize_board(level, new_board), node, move)
+                if new_board.key in closed:
+                    inconsistent.append(child)
                 else:
-                    new_f = None
-                data_structure.push([new_board, current_moves + [move]], new_f)
-        
-        if depth_limit is None:
-            end_time = time.time()
-            print(nodes_explored)
-            print(f"{(end_time - start_time):.2f}")
-            print("No solution found")
-            return
-            
-        current_depth += 1
-        if current_depth > 1000:
-            end_time = time.time()
-            print(nodes_explored)
-            print(f"{(end_time - start_time):.2f}")
-            print("No solution found")
+                    open_list.push(child, new_g + weight * heuristic(child.board))
+
+        if goal is not None and (best.moves is None or goal.depth < len(best.moves)):
+            best = SearchResult(get_path(goal), goal.board, nodes_explored, time.time() - start_time)
+            if report is not None:
+                report(best, weight)
+        best.nodes_explored = nodes_explored
+        best.elapsed = time.time() - start_time
+        # A pass has settled every board only when nothing is left waiting in
+        # inconsistent; until then a shorter solution may still be hiding.
+        if time.time() >= deadline or (not inconsistent and (open_list.is_empty() or (goal is not None and weight == 1))):
+            return best
+
+        weight = max(1.0, weight - ANYTIME_STEP)
+        reopened = PriorityQueue()
+        while not open_list.is_empty():
+            node, _ = open_list.pop()
+            reopened.push(node, node.depth + weight * heuristic(node.board))
+        for node in inconsistent:
+            reopened.push(node, node.depth + weight * heuristic(node.board))
+        open_list = reopened
+
+def print_improvement(result, weight):
+    print(f"weight {weight:g}: {len(result.moves)} moves, {result.nodes_explored} nodes, {result.elapsed:.2f}s", flush=True)
+
+def parallel_worker(filename, shard, workers, use_heuristic, inboxes, outbox):
+    # Owns every board whose key % workers == shard: its best g, the parent
+    # key and move that reached it with that g, and the open boards among
+    # them. Children go straight to their owner's inbox; the coordinator only
+    # starts each round and says how many batches to wait for.
+    level, board = load_board(filename)
+    if use_heuristic:
+        level = use_pattern_database(level, filename, board)
+    inbox = inboxes[shard]
+    limit = PARALLEL_BATCH if use_heuristic else None
+    best_g = {}
+    parents = {}
+    open_list = PriorityQueue()
+    held = {}
+
+    def receive(batch):
+        for f, cells, zobrist, mirror, g, parent_key, move in batch:
+            key = zobrist if mirror is None else min(zobrist, mirror)
+            if best_g.get(key, g + 1) <= g:
+                continue
+            best_g[key] = g
+            parents[key] = (parent_key, move)
+            open_list.push((cells, zobrist, mirror, g), f)
+
+    while True:
+        message = inbox.get()
+        match message[0]:
+            case "batch":
+                held.setdefault(message[1], []).append(message[2])
+            case "round":
+                _, round_number, expected, bound = message
+                # Batches for this round may still be in flight from the other
+                # workers; those for the next round cannot be sent before it.
+                while len(held.get(round_number, [])) < expected:
+                    _, batch_round, batch = inbox.get()
+                    held.setdefault(batch_round, []).append(batch)
+                for batch in held.pop(round_number, []):
+                    receive(batch)
+                buckets = [[] for _ in range(workers)]
+                goals = []
+                expanded = 0
+                while not open_list.is_empty() and (limit is None or expanded + len(goals) < limit):
+                    item, f = open_list.pop()
+                    if f > bound:
+                        open_list.push(item, f)
+                        break
+                    cells, zobrist, mirror, g = item
+                    node_board = Board(level, cells, None, zobrist, mirror)
+                    key = node_board.key
+                    if best_g[key] < g:
+                        continue
+                    if check_solution(node_board):
+                        goals.append((cells, key))
+                        continue
+                    expanded += 1
+                    for child_move in get_available_moves(level, node_board):
+                        child = apply_move(level, node_board, child_move)
+                        owner = child.key % workers
+                        if owner == shard and best_g.get(child.key, g + 2) <= g + 1:
+                            continue
+                        child = normalize_board(level, child)
+                        f = g + 1 + (calculate_heuristic(level, child) if use_heuristic else 0)
+                        buckets[owner].append((f, child.cells, child.zobrist, child.mirror, g + 1, key, child_move))
+                receive(buckets[shard])
+                sent = [0] * workers
+                lowest = [open_list.queue[0][0]] if not open_list.is_empty() else []
+                for owner, bucket in enumerate(buckets):
+                    if owner != shard and bucket:
+                        inboxes[owner].put(("batch", round_number + 1, bucket))
+                        sent[owner] = 1
+                        lowest.append(min(child[0] for child in bucket))
+                outbox.put((expanded, goals, sent, min(lowest, default=None)))
+            case "parent":
+                outbox.put(parents[message[1]])
+            case "stop":
+                # Batches nobody will read must not keep this process alive.
+                for queue in inboxes:
+                    queue.cancel_join_thread()
+                return
+
+def parallel_path(inboxes, outbox, key):
+    moves = []
+    while key is not None:
+        inboxes[key % len(inboxes)].put(("parent", key))
+        key, move = outbox.get()
+        if move is not None:
+            moves.append(move)
+    moves.reverse()
+    return moves
+
+def parallel_rounds(level, board, inboxes, outbox, start_time, use_heuristic):
+    # Each round every worker expands its open boards with f <= bound, the
+    # lowest f anywhere, so a goal popped in a round is optimal as in serial
+    # A*. BFS is the case f = g, where a round is one layer.
+    workers = len(inboxes)
+    nodes_explored = 0
+    bound = calculate_heuristic(level, board) if use_heuristic else 0
+    owner = board.key % workers
+    inboxes[owner].put(("batch", 0, [(bound, board.cells, board.zobrist, board.mirror, 0, None, None)]))
+    expected = [0] * workers
+    expected[owner] = 1
+    round_number = 0
+    while bound is not None and bound != float('inf'):
+        for shard, inbox in enumerate(inboxes):
+            inbox.put(("round", round_number, expected[shard], bound))
+        expected = [0] * workers
+        goals = []
+        lowest = []
+        for _ in range(workers):
+            expanded, worker_goals, sent, worker_lowest = outbox.get()
+            nodes_explored += expanded
+            goals.extend(worker_goals)
+            expected = [total + count for total, count in zip(expected, sent)]
+            if worker_lowest is not None:
+                lowest.append(worker_lowest)
+        if goals:
+            cells, key = min(goals)
+            return SearchResult(parallel_path(inboxes, outbox, key), Board(level, cells), nodes_explored, time.time() - start_time)
+        bound = min(lowest, default=None)
+        round_number += 1
+    return SearchResult(None, None, nodes_explored, time.time() - start_time)
+
+def parallel_search(level, filename, board, workers, use_heuristic):
+    import multiprocessing
+    start_time = time.time()
+    board = normalize_board(level, board)
+    outbox = multiprocessing.Queue()
+    inboxes = [multiprocessing.Queue() for _ in range(workers)]
+    processes = [multiprocessing.Process(target=parallel_worker, args=(filename, shard, workers, use_heuristic, inboxes, outbox), daemon=True)
+                 for shard in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        return parallel_rounds(level, board, inboxes, outbox, start_time, use_heuristic)
+    finally:
+        for inbox in inboxes:
+            inbox.put(("stop",))
+        for process in processes:
+            process.join()
+
+def read_records(path, record_size):
+    import mmap
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for offset in range(0, len(data), record_size):
+            yield data[offset:offset + record_size]
+
+def write_records(path, records):
+    count = 0
+    with open(path, 'wb') as file:
+        for record in records:
+            file.write(record)
+            count += 1
+    return count
+
+def unique_states(records, state_size):
+    previous = None
+    for record in records:
+        state = record[:state_size]
+        if state != previous:
+            previous = state
+            yield record
+
+def subtract_layer(records, path, record_size, state_size):
+    others = read_records(path, record_size)
+    other = next(others, None)
+    for record in records:
+        state = record[:state_size]
+        while other is not None and other[:state_size] < state:
+            other = next(others, None)
+        if other is None or other[:state_size] != state:
+            yield record
+
+def find_record(path, state, record_size, state_size):
+    import mmap
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        low, high = 0, len(data) // record_size
+        while low < high:
+            middle = (low + high) // 2
+            if data[middle * record_size:middle * record_size + state_size] < state:
+                low = middle + 1
+            else:
+                high = middle
+        return data[low * record_size:(low + 1) * record_size]
+
+def external_bfs(level, board, memory_limit):
+    # Breadth-first search with delayed duplicate detection. Each layer is a
+    # file of fixed-width records (state, parent state, piece, direction)
+    # sorted by state. Children are buffered up to memory_limit bytes, spilled
+    # to sorted run files, then merged and stripped of the two previous
+    # layers, which is enough because every move can be undone.
+    import tempfile
+    start_time = time.time()
+    nodes_explored = 0
+    board = normalize_board(level, board)
+    state_size = len(board.cells)
+    record_size = 2 * state_size + 2
+    buffer_limit = max(1, memory_limit // (sys.getsizeof(bytes(record_size)) + 8))
+    directions = ["UP", "RIGHT", "DOWN", "LEFT"]
+
+    with tempfile.TemporaryDirectory(prefix="sbp-bfs-") as directory:
+        layers = [os.path.join(directory, "layer-0")]
+        write_records(layers[0], [board.cells + bytes(state_size + 2)])
+        while True:
+            depth = len(layers) - 1
+            runs = []
+            buffer = []
+            for record in read_records(layers[depth], record_size):
+                state = record[:state_size]
+                current_board = Board(level, state)
+                if check_solution(current_board):
+                    moves = []
+                    for layer in reversed(layers[:depth]):
+                        moves.append((record[-2], directions[record[-1]]))
+                        record = find_record(layer, record[state_size:2 * state_size], record_size, state_size)
+                    moves.reverse()
+                    return SearchResult(moves, current_board, nodes_explored, time.time() - start_time)
+
+                nodes_explored += 1
+                for piece, direction in get_available_moves(level, current_board):
+                    child = normalize_board(level, apply_move(level, current_board, (piece, direction)))
+                    buffer.append(child.cells + state + bytes((piece, directions.index(direction))))
+                if len(buffer) >= buffer_limit:
+                    buffer.sort()
+                    runs.append(os.path.join(directory, f"run-{depth}-{len(runs)}"))
+                    write_records(runs[-1], unique_states(buffer, state_size))
+                    buffer = []
+            if buffer:
+                buffer.sort()
+                runs.append(os.path.join(directory, f"run-{depth}-{len(runs)}"))
+                write_records(runs[-1], unique_states(buffer, state_size))
+                buffer = []
+
+            records = unique_states(heapq.merge(*(read_records(run, record_size) for run in runs)), state_size)
+            for layer in layers[-2:]:
+                records = subtract_layer(records, layer, record_size, state_size)
+            layers.append(os.path.join(directory, f"layer-{depth + 1}"))
+            count = write_records(layers[-1], records)
+            for run in runs:
+                os.remove(run)
+            if count == 0:
+                return SearchResult(None, None, nodes_explored, time.time() - start_time)
+
+def import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        print("Error: --vectorized requires NumPy (pip install numpy)")
+        sys.exit(1)
+    return numpy
+
+def row_keys(np, states):
+    # One opaque value per row, so rows can be sorted and compared whole.
+    return np.ascontiguousarray(states).view(np.dtype((np.void, states.shape[1]))).ravel()
+
+def normalize_states(np, states, labels):
+    # normalize_board for a whole array of boards: the pieces in labels are
+    # renamed 3, 4, ... by the position of their first cell.
+    if not labels:
+        return states
+    first = np.stack([(states == label).argmax(axis=1) for label in labels], axis=1)
+    rank = np.argsort(np.argsort(first, axis=1), axis=1).astype(np.uint8)
+    normalized = states.copy()
+    for j, label in enumerate(labels):
+        normalized = np.where(states == label, (rank[:, j] + 3)[:, None], normalized)
+    return normalized
+
+def canonical_states(np, level, states, labels):
+    # Like Board.key: on a symmetric level a board and its mirror image are
+    # the same state, so take whichever normalized row sorts first.
+    if level.mirror_cells is None:
+        return row_keys(np, states)
+    grid = states.reshape(len(states), level.rows, level.cols)
+    mirrored = normalize_states(np, np.ascontiguousarray(grid[:, :, ::-1]).reshape(states.shape), labels)
+    differ = states != mirrored
+    first = differ.argmax(axis=1)
+    rows = np.arange(len(states))
+    smaller = states[rows, first] <= mirrored[rows, first]
+    return row_keys(np, np.where(smaller[:, None], states, mirrored))
+
+def shift_masks(np, mask, direction):
+    shifted = np.zeros_like(mask)
+    match direction:
+        case "UP":
+            shifted[:, :-1, :] = mask[:, 1:, :]
+            edge = mask[:, 0, :].any(axis=1)
+        case "DOWN":
+            shifted[:, 1:, :] = mask[:, :-1, :]
+            edge = mask[:, -1, :].any(axis=1)
+        case "LEFT":
+            shifted[:, :, :-1] = mask[:, :, 1:]
+            edge = mask[:, :, 0].any(axis=1)
+        case "RIGHT":
+            shifted[:, :, 1:] = mask[:, :, :-1]
+            edge = mask[:, :, -1].any(axis=1)
+    return shifted, edge
+
+def expand_states(np, level, states, pieces, directions):
+    # Every legal move of every board at once: for each piece and direction,
+    # the boards where the shifted piece only lands on empty cells, itself,
+    # or (for piece 2) the goal.
+    grid = states.reshape(len(states), level.rows, level.cols)
+    children, parents, moved, moved_directions = [], [], [], []
+    for piece in pieces:
+        mask = grid == piece
+        allowed = mask | (grid == EMPTY_CELL)
+        if piece == 2:
+            allowed |= grid == GOAL_CELL
+        for d, direction in enumerate(directions):
+            shifted, edge = shift_masks(np, mask, direction)
+            rows = np.nonzero(~edge & ~(shifted & ~allowed).any(axis=(1, 2)))[0]
+            if len(rows) == 0:
+                continue
+            child = np.where(mask[rows], EMPTY_CELL, grid[rows])
+            child = np.where(shifted[rows], piece, child).astype(np.uint8)
+            children.append(child.reshape(len(rows), -1))
+            parents.append(rows)
+            moved.append(np.full(len(rows), piece, dtype=np.uint8))
+            moved_directions.append(np.full(len(rows), d, dtype=np.uint8))
+    if not children:
+        return np.empty((0, states.shape[1]), dtype=np.uint8), np.empty(0, dtype=np.intp), np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.uint8)
+    return np.concatenate(children), np.concatenate(parents), np.concatenate(moved), np.concatenate(moved_directions)
+
+def vectorized_bfs(level, board):
+    # Layer-by-layer BFS over NumPy arrays with one board per row. As in
+    # external_bfs, a new layer only has to be checked against itself and
+    # the two layers before it because every move can be undone.
+    np = import_numpy()
+    start_time = time.time()
+    nodes_explored = 0
+    board = normalize_board(level, board)
+    pieces = list(board.pieces)
+    labels = [piece for piece in pieces if piece != 2]
+    directions = ["UP", "RIGHT", "DOWN", "LEFT"]
+
+    states = np.frombuffer(board.cells, dtype=np.uint8).reshape(1, -1).copy()
+    layers = []
+    seen = [canonical_states(np, level, states, labels)]
+    while len(states):
+        solved = np.nonzero(~(states == GOAL_CELL).any(axis=1))[0]
+        if len(solved):
+            index = solved[0]
+            end_board = Board(level, states[index].tobytes())
+            moves = []
+            for parents, moved, moved_directions in reversed(layers):
+                moves.append((int(moved[index]), directions[moved_directions[index]]))
+                index = parents[index]
+            moves.reverse()
+            return SearchResult(moves, end_board, nodes_explored, time.time() - start_time)
+
+        nodes_explored += len(states)
+        children, parents, moved, moved_directions = expand_states(np, level, states, pieces, directions)
+        children = normalize_states(np, children, labels)
+        keys = canonical_states(np, level, children, labels)
+        _, first = np.unique(keys, return_index=True)
+        first.sort()
+        keep = first[~np.isin(keys[first], np.concatenate(seen))]
+        states = children[keep]
+        layers.append((parents[keep], moved[keep], moved_directions[keep]))
+        seen = [seen[-1], keys[keep]]
+    return SearchResult(None, None, nodes_explored, time.time() - start_time)
+
+def parse_options(argv):
+    args = []
+    options = {}
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if not arg.startswith("--"):
+            args.append(arg)
+        elif arg in FLAG_OPTIONS:
+            options[arg[2:]] = True
+        elif arg in VALUE_OPTIONS:
+            if i + 1 >= len(argv):
+                print(f"Error: Option '{arg}' requires a value")
+                sys.exit(1)
+            options[arg[2:]] = argv[i + 1]
+            i += 1
+        else:
+            print(f"Error: Unknown option '{arg}'")
+            sys.exit(1)
+        i += 1
+    return args, options
+
+def select_engine(options):
+    return bitboard if options.get("bitboard") else sys.modules[__name__]
+
+def worker_count(options, default=1):
+    try:
+        workers = int(options.get("workers", default))
+    except ValueError:
+        workers = 0
+    if workers < 1:
+        print("Error: --workers must be a positive integer")
+        sys.exit(1)
+    return workers
+
+def beam_width(options):
+    try:
+        width = int(options.get("width", BEAM_WIDTH))
+    except ValueError:
+        width = 0
+    if width < 1:
+        print("Error: --width must be a positive integer")
+        sys.exit(1)
+    return width
+
+def pattern_limit(text):
+    try:
+        limit = int(text)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        print("Error: Pattern database size limit must be a positive integer")
+        sys.exit(1)
+    return limit
+
+def anytime_options(options):
+    try:
+        time_ms = int(options.get("time-ms", ANYTIME_TIME_MS))
+        weight = float(options.get("weight", ANYTIME_WEIGHT))
+    except ValueError:
+        time_ms = weight = 0
+    if time_ms < 1 or weight < 1:
+        print("Error: --time-ms must be a positive integer and --weight at least 1")
+        sys.exit(1)
+    return time_ms, weight
+
+def memory_limit(options):
+    try:
+        megabytes = int(options.get("memory", EXTERNAL_MEMORY_MB))
+    except ValueError:
+        megabytes = 0
+    if megabytes < 1:
+        print("Error: --memory must be a positive number of megabytes")
+        sys.exit(1)
+    return megabytes << 20
+
+def to_engine(level, board, engine):
+    if engine is bitboard:
+        bit_level = bitboard.BitLevel(level.layout, level.cols, level.rows, level.distance_fields,
+                                      level.zobrist_cells, level.zobrist_goals)
+        return bit_level, bitboard.from_board(bit_level, board)
+    return level, board
+
+def engine_search(level, board, data_structure, engine, stats=None):
+    # Runs search on engine's boards and hands back the result on this
+    # file's boards, whichever engine found it.
+    engine_level, engine_board = to_engine(level, board, engine)
+    result = search(engine_level, engine_board, data_structure, engine, stats)
+    if engine is bitboard and result.board is not None:
+        cells = bytes(value & 0xFF for value in bitboard.to_cells(engine_level, result.board))
+        result.board = Board(level, cells)
+    return result
+
+def run_search(command, level, filename, board, options, report=None, stats=None):
+    engine = select_engine(options)
+    workers = worker_count(options)
+    if workers > 1 and filename is None:
+        print("Error: --workers needs a board file")
+        sys.exit(1)
+    if options.get("bitboard") and command not in BITBOARD_COMMANDS:
+        print("Error: --bitboard only supports bfs, dfs and astar")
+        sys.exit(1)
+    if workers > 1 and command not in WORKER_COMMANDS:
+        print("Error: --workers only supports bfs and astar")
+        sys.exit(1)
+    if (options.get("external") or options.get("vectorized")) and command != "bfs":
+        print("Error: --external and --vectorized only support bfs")
+        sys.exit(1)
+    if sum(1 for mode in (options.get("bitboard"), options.get("external"), options.get("vectorized"), workers > 1) if mode) > 1:
+        print("Error: --bitboard, --external, --vectorized and --workers cannot be combined")
+        sys.exit(1)
+    if stats is not None and (command not in STATS_COMMANDS or workers > 1
+                              or options.get("external") or options.get("vectorized")):
+        print("Error: --stats only supports single-process bfs, dfs, astar, ids and idastar")
+        sys.exit(1)
+    match command:
+        case "bfs":
+            if options.get("external"):
+                return external_bfs(level, board, memory_limit(options))
+            if options.get("vectorized"):
+                return vectorized_bfs(level, board)
+            if workers > 1:
+                return parallel_search(level, filename, board, workers, False)
+            return engine_search(level, board, Queue(), engine, stats)
+        case "dfs":
+            return engine_search(level, board, Stack(), engine, stats)
+        case "ids":
+            return iterative_deepening(level, board, stats)
+        case "idastar":
+            level = use_pattern_database(level, filename, board)
+            return ida_star(level, board, stats)
+        case "astar":
+            level = use_pattern_database(level, filename, board)
+            if workers > 1:
+                return parallel_search(level, filename, board, workers, True)
+            return engine_search(level, board, PriorityQueue(), engine, stats)
+        case "beam":
+            level = use_pattern_database(level, filename, board)
+            return beam_search(level, board, beam_width(options))
+        case "anytime":
+            time_ms, weight = anytime_options(options)
+            level = use_pattern_database(level, filename, board)
+            return anytime_search(level, board, time.time() + time_ms / 1000, weight, report)
+
+def instrumented_search(command, level, filename, board, options, report=None):
+    # run_search wrapped in the --stats, --profile and --trace-memory hooks.
+    stats = None
+    if "stats" in options:
+        if options["stats"] != "json":
+            print("Error: --stats only supports 'json'")
+            sys.exit(1)
+        stats = SearchStats()
+    elif options.get("trace-memory"):
+        print("Error: --trace-memory needs --stats json")
+        sys.exit(1)
+    if "profile" in options:
+        import cProfile
+    if options.get("trace-memory"):
+        import tracemalloc
+    profiler = cProfile.Profile() if "profile" in options else None
+    if options.get("trace-memory"):
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        result = run_search(command, level, filename, board, options, report, stats)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(options["profile"])
+        if options.get("trace-memory"):
+            stats.memory_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return result, stats
+
+def board_text(level, board, engine):
+    output = io.StringIO()
+    with redirect_stdout(output):
+        engine.print_board(level, board)
+    return output.getvalue()
+
+def run_request(request):
+    # One request of the batch protocol: the board comes from "file" or from
+    # "board", the text of a level file, and the options are plain keys.
+    options = {name: request[name] for name in ("bitboard", "external", "vectorized", "workers", "memory", "width", "time-ms", "weight") if name in request}
+    engine = select_engine(options)
+    filename = request.get("file")
+    if "board" in request:
+        filename = None
+        level, board = parse_board(request["board"].splitlines(), "request")
+    elif filename is not None:
+        level, board = load_board(filename)
+    else:
+        print("Error: Request needs a 'file' or a 'board'")
+        sys.exit(1)
+
+    command = request.get("command")
+    match command:
+        case "print":
+            return {"board": board_text(level, board, sys.modules[__name__])}
+        case "norm":
+            return {"board": board_text(level, normalize_board(level, board), sys.modules[__name__])}
+        case "done":
+            return {"done": check_solution(board)}
+        case "availableMoves":
+            return {"moves": [list(move) for move in engine.get_available_moves(*to_engine(level, board, engine))]}
+        case "applyMove":
+            if "move" not in request:
+                print("Error: Move required for applyMove command")
+                sys.exit(1)
+            engine_level, board = to_engine(level, board, engine)
+            board = engine.apply_move(engine_level, board, parse_move(request["move"]))
+            return {"board": board_text(engine_level, board, engine)}
+        case _ if command in SEARCH_COMMANDS:
+            stats = SearchStats() if request.get("stats") else None
+            result = run_search(command, level, filename, board, options, None, stats)
+            response = {"nodes": result.nodes_explored, "time": round(result.elapsed, 3)}
+            if result.moves is None:
+                response["moves"] = None
+            else:
+                response["moves"] = [list(move) for move in result.moves]
+                response["board"] = board_text(level, result.board, sys.modules[__name__])
+            if stats is not None:
+                response["stats"] = stats.to_dict(result)
+            return response
+        case _:
+            print(f"Error: Unknown command '{command}'")
+            sys.exit(1)
+
+def handle_request(line):
+    # Errors end the request, not the server: whatever the command printed
+    # before exiting becomes the "error" field of its response.
+    output = io.StringIO()
+    response = {}
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("request must be a JSON object")
+        if "id" in request:
+            response["id"] = request["id"]
+        with redirect_stdout(output):
+            response.update(run_request(request))
+    except SystemExit:
+        lines = output.getvalue().strip().splitlines()
+        response["error"] = lines[-1].removeprefix("Error: ") if lines else "Request failed"
+    except Exception as error:
+        response["error"] = str(error)
+    return json.dumps(response)
+
+def serve_stream(reader, writer):
+    for line in reader:
+        if not line.strip():
+            continue
+        writer.write(handle_request(line) + "\n")
+        writer.flush()
+
+def serve_socket(path):
+    import socketserver
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                self.wfile.write((handle_request(line) + "\n").encode())
+                self.wfile.flush()
+
+    # Only a stale socket from an earlier serve is removed; anything else at
+    # path is left alone.
+    if os.path.lexists(path):
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            print(f"Error: '{path}' exists and is not a socket")
+            sys.exit(1)
+        os.unlink(path)
+    with socketserver.UnixStreamServer(path, RequestHandler) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(path)
+
+def level_files(pattern):
+    import glob
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.txt")
+    return sorted(glob.glob(pattern))
+
+def load_history(filename):
+    if filename is None or not os.path.exists(filename):
+        return {}
+    try:
+        with open(filename, 'r') as file:
+            return json.load(file)
+    except (IOError, ValueError):
+        print(f"Error: Could not read history '{filename}'")
+        sys.exit(1)
+
+def save_history(filename, history):
+    try:
+        with open(filename, 'w') as file:
+            json.dump(history, file, indent=1, sort_keys=True)
+    except IOError:
+        print(f"Error: Could not write history '{filename}'")
+        sys.exit(1)
+
+def solve_worker(request, options, results):
+    # Runs in its own process; sqlite connections must not cross a fork, so
+    # the solution cache is opened again here.
+    use_solution_cache(options)
+    results.put((request["id"], handle_request(json.dumps(request))))
+
+def solve_all(files, command, options):
+    # Solves every file in its own process, at most workers at a time, and
+    # prints each batch-protocol response as soon as it is ready. Files
+    # that took longest last time (or have no history yet, biggest first)
+    # start first so a long puzzle does not hold up the end of the run.
+    workers = worker_count(options, os.cpu_count() or 1)
+    try:
+        timeout = float(options.get("timeout", SOLVE_TIMEOUT))
+    except ValueError:
+        timeout = 0
+    if timeout <= 0:
+        print("Error: --timeout must be a positive number of seconds")
+        sys.exit(1)
+    history_file = options.get("history")
+    history = load_history(history_file)
+    # History is keyed on the absolute path so it still applies when the
+    # same files are named from another directory.
+    pending = sorted(files, key=lambda filename: (os.path.abspath(filename) in history, -history.get(os.path.abspath(filename), 0),
+                                                  -os.path.getsize(filename)))
+    pending.reverse()
+    request_options = {name: options[name] for name in ("bitboard", "external", "vectorized", "memory", "width", "time-ms", "weight")
+                       if name in options}
+
+    import multiprocessing
+    from queue import Empty
+    results = multiprocessing.Queue()
+    running = {}
+
+    def finish(filename, response):
+        # A response can still arrive from a process already reported as
+        # timed out; it is dropped.
+        if filename not in running:
             return
+        process, start_time = running.pop(filename)
+        process.join()
+        history[os.path.abspath(filename)] = time.time() - start_time
+        print(response, flush=True)
+
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                filename = pending.pop()
+                request = dict(request_options, id=filename, command=command, file=filename)
+                process = multiprocessing.Process(target=solve_worker, args=(request, options, results), daemon=True)
+                process.start()
+                running[filename] = (process, time.time())
+            try:
+                finish(*results.get(timeout=0.05))
+            except Empty:
+                pass
+            # Deadlines are checked on every pass, so a steady stream of
+            # responses from other files cannot hold them off.
+            now = time.time()
+            for filename, (process, start_time) in list(running.items()):
+                if filename not in running or (now - start_time < timeout and process.is_alive()):
+                    continue
+                if not process.is_alive():
+                    # A process flushes its response before it exits, so
+                    # anything it sent is already waiting in the queue.
+                    try:
+                        while True:
+                            finish(*results.get_nowait())
+                    except Empty:
+                        pass
+                    if filename not in running:
+                        continue
+                process.kill()
+                process.join()
+                del running[filename]
+                history[os.path.abspath(filename)] = now - start_time
+                error = f"Timed out after {timeout:g}s" if now - start_time >= timeout else "Solver process died"
+                print(json.dumps({"id": filename, "error": error}), flush=True)
+    finally:
+        for process, _ in running.values():
+            process.kill()
+            process.join()
+        if history_file is not None:
+            save_history(history_file, history)
+
+def write_scrambles(level, scrambles, command, filename, output):
+    # Without an output directory the corpus is JSON lines in the batch
+    # protocol; with one, every board becomes a level file of its own.
+    module = sys.modules[__name__]
+    if output is None:
+        for k, (scrambled, depth) in enumerate(scrambles):
+            text = board_text(level, normalize_board(level, scrambled), module)
+            print(json.dumps({"id": k, "command": command, "depth": depth, "board": text}))
+        return
+    name = os.path.splitext(os.path.basename(filename))[0]
+    try:
+        os.makedirs(output, exist_ok=True)
+        for k, (scrambled, depth) in enumerate(scrambles):
+            with open(os.path.join(output, f"{name}-scramble-{depth}-{k}.txt"), 'w') as file:
+                file.write(board_text(level, normalize_board(level, scrambled), module))
+    except IOError:
+        print(f"Error: Could not write scrambles to '{output}'")
+        sys.exit(1)
 
 def main():
-    if len(sys.argv) < 2:
+    args, options = parse_options(sys.argv)
+    use_solution_cache(options)
+    if len(args) < 2:
         print("Usage: python3 sbp.py <command> [<optional-argument>]")
         sys.exit(1)
     
-    command = sys.argv[1]
+    command = args[1]
     
     match command:
         case "print":
-            if len(sys.argv) != 3:
+            if len(args) != 3:
                 print("Error: Board file required for print command")
                 sys.exit(1)
-            filename = sys.argv[2]
-            board = load_board(filename)
-            print_board(board)
+            filename = args[2]
+            level, board = load_board(filename)
+            print_board(level, board)
         case "done":
-            if len(sys.argv) != 3:
+            if len(args) != 3:
                 print("Error: Board file required for done command") 
                 sys.exit(1)
-            filename = sys.argv[2]
-            board = load_board(filename)
+            filename = args[2]
+            level, board = load_board(filename)
             result = check_solution(board)
             print(result)
         case "availableMoves":
-            if len(sys.argv) != 3:
+            if len(args) != 3:
                 print("Error: Board file required for availableMoves command")
                 sys.exit(1)
-            filename = sys.argv[2]
-            board = load_board(filename)
-            available_moves = get_available_moves(board)
+            filename = args[2]
+            level, board = load_board(filename)
+            engine = select_engine(options)
+            level, board = to_engine(level, board, engine)
+            available_moves = engine.get_available_moves(level, board)
             for piece, direction in available_moves:
                 print(f"({piece}, {direction})")
         case "applyMove":
-            if len(sys.argv) != 4:
+            if len(args) != 4:
                 print("Error: Board file and move required for applyMove command")
                 sys.exit(1)
-            filename = sys.argv[2]
-            board = load_board(filename)
-            move = parse_move(sys.argv[3])
-            board = apply_move(board, move)
-            print_board(board)
+            filename = args[2]
+            level, board = load_board(filename)
+            engine = select_engine(options)
+            level, board = to_engine(level, board, engine)
+            move = parse_move(args[3])
+            board = engine.apply_move(level, board, move)
+            engine.print_board(level, board)
         case "compare":
-            if len(sys.argv) != 4:
+            if len(args) != 4:
                 print("Error: Two board files required for comparison")
                 sys.exit(1)
-            board1 = load_board(sys.argv[2])
-            board2 = load_board(sys.argv[3])
-            result = compare_boards(board1, board2)
+            level1, board1 = load_board(args[2])
+            level2, board2 = load_board(args[3])
+            result = compare_boards(level1, board1, level2, board2)
             print(result)
         case "norm":
-            if len(sys.argv) != 3:
+            if len(args) != 3:
                 print("Error: Board file required for norm command")
                 sys.exit(1)
-            filename = sys.argv[2]
-            board = load_board(filename)
-            normalized_board = normalize_board(board)
-            print_board(normalized_board)
+            filename = args[2]
+            level, board = load_board(filename)
+            normalized_board = normalize_board(level, board)
+            print_board(level, normalized_board)
         case "random":
-            if len(sys.argv) != 4:
+            if len(args) != 4:
                 print("Error: Board file required for random command")
                 sys.exit(1)
-            filename = sys.argv[2]
-            n_moves = int(sys.argv[3])
-            board = load_board(filename)
-            #print_board(board)
-            random_walk(board, n_moves)
-        case "bfs":
-            if len(sys.argv) != 3:
-                print("Error: Board file required for bfs command")
+            filename = args[2]
+            n_moves = int(args[3])
+            level, board = load_board(filename)
+            #print_board(level, board)
+            random_walk(level, board, n_moves)
+        case "bfs" | "dfs" | "ids" | "idastar" | "astar" | "beam":
+            if len(args) != 3:
+                print(f"Error: Board file required for {command} command")
                 sys.exit(1)
-            filename = sys.argv[2]  
-            board = load_board(filename)
-            search(board, Queue())
-        case "dfs":
-            if len(sys.argv) != 3:
-                print("Error: Board file required for dfs command")
+            filename = args[2]
+            level, board = load_board(filename)
+            result, stats = instrumented_search(command, level, filename, board, options)
+            print_result(level, result)
+            if stats is not None:
+                print(json.dumps(stats.to_dict(result)))
+        case "anytime":
+            if len(args) != 3:
+                print("Error: Board file required for anytime command")
                 sys.exit(1)
-            filename = sys.argv[2]
-            board = load_board(filename)
-            search(board, Stack())
-        case "ids":
-            if len(sys.argv) != 3:
-                print("Error: Board file required for ids command")
+            filename = args[2]
+            level, board = load_board(filename)
+            result, stats = instrumented_search(command, level, filename, board, options, print_improvement)
+            print()
+            print_result(level, result)
+            if stats is not None:
+                print(json.dumps(stats.to_dict(result)))
+        case "batch":
+            serve_stream(sys.stdin, sys.stdout)
+        case "scramble":
+            if len(args) not in (5, 6):
+                print("Error: Board file, count and depth required for scramble command")
                 sys.exit(1)
-            filename = sys.argv[2]
-            board = load_board(filename)
-            search(board, Stack(), 1)
-        case "astar":
-            if len(sys.argv) != 3:
-                print("Error: Board file required for astar command")
+            filename = args[2]
+            try:
+                count, depth, seed = int(args[3]), int(args[4]), int(options.get("seed", 380))
+            except ValueError:
+                count = depth = seed = -1
+            if count < 1 or depth < 1:
+                print("Error: count and depth must be positive integers")
+                sys.exit(1)
+            command = args[5] if len(args) == 6 else "astar"
+            if command not in SEARCH_COMMANDS:
+                print(f"Error: Unknown algorithm '{command}'")
+                sys.exit(1)
+            level, board = load_board(filename)
+            rng = random.Random(seed)
+            if options.get("exact"):
+                scrambles = exact_scrambles(level, board, count, depth, rng)
+            else:
+                scrambles = random_scrambles(level, board, count, depth, rng)
+            if len(scrambles) < count:
+                print(f"Error: Only found {len(scrambles)} distinct boards at depth {depth}")
+                sys.exit(1)
+            write_scrambles(level, scrambles, command, filename, options.get("output"))
+        case "solve-all":
+            if len(args) not in (3, 4):
+                print("Error: Level directory or glob required for solve-all command")
+                sys.exit(1)
+            algorithm = args[3] if len(args) == 4 else "astar"
+            if algorithm not in SEARCH_COMMANDS:
+                print(f"Error: Unknown algorithm '{algorithm}'")
+                sys.exit(1)
+            files = level_files(args[2])
+            if not files:
+                print(f"Error: No level files match '{args[2]}'")
+                sys.exit(1)
+            solve_all(files, algorithm, options)
+        case "serve":
+            if "socket" not in options:
+                print("Error: --socket required for serve command")
+                sys.exit(1)
+            serve_socket(options["socket"])
+        case "pdb":
+            if len(args) not in (3, 4):
+                print("Error: Board file required for pdb command")
                 sys.exit(1)
-            filename = sys.argv[2]
-            board = load_board(filename)
-            search(board, PriorityQueue())
+            filename = args[2]
+            limit = pattern_limit(args[3]) if len(args) == 4 else PDB_LIMIT
+            level, board = load_board(filename)
+            start_time = time.time()
+            databases = build_pattern_databases(level, normalize_board(level, board), limit)
+            pdb_filename = pattern_database_filename(filename)
+            save_pattern_databases(level, databases, pdb_filename)
+            print(pdb_filename)
+            for database in databases:
+                print(f"goal cells {database.goals}")
+                for footprint, count in database.classes:
+                    print(f"{count} x {list(footprint)}")
+                print(database.size)
+            print(f"{(time.time() - start_time):.2f}")
         case _:
             print(f"Error: Unknown command '{command}'")
             sys.exit(1)